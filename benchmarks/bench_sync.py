@@ -0,0 +1,205 @@
+"""
+End-to-end benchmark of DataTransferTool: synthetic CSV devices -> in-process fake NetBox.
+
+Measures the engine's own overhead (rendering, transforms, lookups, diffing) with no real
+network involved, optionally adding simulated API latency.
+
+    python -m benchmarks.bench_sync --rows 1000 10000 100000
+    python -m benchmarks.bench_sync --rows 10000 --existing 0.5 --changed 0.1 --latency-ms 2
+    python -m benchmarks.bench_sync --rows 1000000 --memory --json bench.json
+"""
+import argparse
+import json
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+
+import data_transfer_tool
+from benchmarks import fake_netbox
+from benchmarks.datagen import ROLES, SITE_COUNT, device_row, generate_devices_csv
+from utils.log import setup_logging
+from utils.timer import Timer
+
+BASE_URL = 'http://fake-netbox'
+
+CONFIG_TEMPLATE = """
+api_definitions:
+  devices_csv:
+    type: csv
+    source_mapping:
+      file_path:
+        - {csv_path}
+  netbox:
+    type: api
+    module: benchmarks.fake_netbox
+    auth_method: token
+    auth_function: api
+    auth_args:
+      token: benchmark
+    base_urls:
+      - {base_url}
+
+object_mappings:
+  devices:
+    source_api: devices_csv
+    destination_api: netbox
+    find_function: dcim.devices.filter
+    create_function: dcim.devices.create
+    update_function: dcim.devices.update
+    mapping:
+      name:
+        source: "{{{{ device_name }}}}"
+      serial:
+        source: "{{{{ serial }}}}"
+      status:
+        source: "{{{{ status }}}}"
+      site:
+        source: "{{{{ site_name }}}}"
+        action:
+          - lookup_object:
+              field: name
+              find_function: dcim.sites.filter
+              create_function: dcim.sites.create
+      role:
+        source: "{{{{ role }}}}"
+        action:
+          - lookup_object:
+              field: name
+              find_function: dcim.device_roles.filter
+              create_function: dcim.device_roles.create
+"""
+
+
+def write_config(workdir, csv_path):
+    config_path = os.path.join(workdir, 'bench_config.yaml')
+    with open(config_path, 'w') as f:
+        f.write(CONFIG_TEMPLATE.format(csv_path=csv_path, base_url=BASE_URL))
+    return config_path
+
+
+def preload(netbox, rows, existing, changed):
+    """
+    Pre-create a fraction of the devices (and their sites/roles) so the run exercises the
+    update and no-change paths; a fraction of those differ from the source data.
+    """
+    existing_rows = int(rows * existing)
+    if not existing_rows:
+        return
+    sites = {f"Site{index:03d}": netbox.dcim.sites.create({'name': f"Site{index:03d}"}).id for index in range(SITE_COUNT)}
+    roles = {role: netbox.dcim.device_roles.create({'name': role}).id for role in ROLES}
+    changed_every = int(1 / changed) if changed else 0
+    devices = []
+    for index in range(existing_rows):
+        row = device_row(index)
+        status = row['status']
+        if changed_every and index % changed_every == 0:
+            status = 'decommissioning'
+        devices.append({'name': row['device_name'], 'serial': row['serial'], 'status': status,
+                        'site': sites[row['site_name']], 'role': roles[row['role']]})
+    netbox.dcim.devices.create(devices)
+    # Preloading must not show up in the measured call counts
+    for app in netbox._apps.values():
+        for endpoint in app._endpoints.values():
+            endpoint.calls.clear()
+
+
+def stage_totals(timer):
+    """
+    Total milliseconds and counts per span name, aggregated over labels.
+    """
+    stages = {}
+    for row in timer.summary():
+        stage = stages.setdefault(row['name'], {'count': 0, 'total_ms': 0.0})
+        stage['count'] += row['count']
+        stage['total_ms'] += row['total_ms']
+    return stages
+
+
+def run_benchmark(rows, workdir, latency_ms=0.0, existing=0.0, changed=0.0, trace_memory=False):
+    csv_path = generate_devices_csv(os.path.join(workdir, f"devices_{rows}.csv"), rows)
+    config_path = write_config(workdir, csv_path)
+
+    fake_netbox.reset()
+    fake_netbox.configure(latency_ms=latency_ms)
+    netbox = fake_netbox.instance(BASE_URL)
+    preload(netbox, rows, existing, changed)
+
+    # Fresh span statistics for every run
+    data_transfer_tool.timer = Timer()
+    if trace_memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    tool = data_transfer_tool.DataTransferTool(
+        config_path, False, False,
+        watermark_file=os.path.join(workdir, 'watermarks.json'), full_sync=True,
+    )
+    tool.initialize_sources()
+    tool.process_mappings()
+    elapsed = time.perf_counter() - start
+
+    peak_memory = None
+    if trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        'rows': rows,
+        'latency_ms': latency_ms,
+        'existing': existing,
+        'changed': changed,
+        'seconds': elapsed,
+        'rows_per_sec': rows / elapsed if elapsed else None,
+        'peak_traced_mib': peak_memory / 1048576 if peak_memory is not None else None,
+        'max_rss_mib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'stages': stage_totals(data_transfer_tool.timer),
+        'api_calls': {row['function']: row['calls'] for row in tool.api_stats.summary()},
+        'destination_requests': netbox.call_counts(),
+    }
+
+
+def print_result(result):
+    memory = (f"peak traced {result['peak_traced_mib']:.1f} MiB" if result['peak_traced_mib'] is not None
+              else f"max RSS {result['max_rss_mib']:.1f} MiB")
+    print(f"\n== {result['rows']} rows (existing {result['existing']:.0%}, changed {result['changed']:.0%}, "
+          f"latency {result['latency_ms']} ms)")
+    print(f"   {result['seconds']:.2f} s, {result['rows_per_sec']:.0f} rows/s, {memory}")
+    print(f"   {'stage':<24} {'count':>10} {'total ms':>12} {'per row us':>12}")
+    for name, stage in sorted(result['stages'].items(), key=lambda item: item[1]['total_ms'], reverse=True):
+        per_row = stage['total_ms'] * 1000 / result['rows'] if result['rows'] else 0
+        print(f"   {name:<24} {stage['count']:>10} {stage['total_ms']:>12.1f} {per_row:>12.1f}")
+    print(f"   {'api function':<36} {'calls':>10}")
+    for function, calls in sorted(result['api_calls'].items(), key=lambda item: item[1], reverse=True):
+        print(f"   {function:<36} {calls:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end sync benchmark against a fake NetBox')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000], help='Source row counts to benchmark')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Simulated latency per API request')
+    parser.add_argument('--existing', type=float, default=0.0, help='Fraction of devices that already exist in NetBox')
+    parser.add_argument('--changed', type=float, default=0.0, help='Fraction of existing devices that differ from the source')
+    parser.add_argument('--memory', action='store_true', help='Measure peak memory with tracemalloc (slower)')
+    parser.add_argument('--workdir', help='Directory for generated data (default: a temporary directory)')
+    parser.add_argument('--json', help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    setup_logging('WARNING', queued=False)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='nbsync-bench-')
+    os.makedirs(workdir, exist_ok=True)
+
+    results = []
+    for rows in args.rows:
+        result = run_benchmark(rows, workdir, args.latency_ms, args.existing, args.changed, args.memory)
+        print_result(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
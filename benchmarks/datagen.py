@@ -0,0 +1,44 @@
+"""
+Synthetic source data for the benchmarks, following the columns of sample-data/devices.csv.
+"""
+import csv
+import os
+
+MANUFACTURERS = ['Cisco', 'Juniper', 'Arista', 'Dell', 'HPE', 'Lenovo', 'Palo Alto', 'Fortinet']
+DEVICE_TYPES = ['Switch', 'Router', 'Firewall', 'Server', 'Access Point']
+STATUSES = ['active', 'planned', 'staged', 'offline']
+ROLES = ['Switch/Router', 'Firewall', 'Compute', 'Wireless']
+SITE_COUNT = 100
+
+COLUMNS = ['device_name', 'manufacturer', 'device_type', 'serial', 'site_name', 'status', 'role']
+
+
+def device_row(index):
+    """
+    Deterministic device record number index.
+    """
+    return {
+        'device_name': f"Device{index:07d}",
+        'manufacturer': MANUFACTURERS[index % len(MANUFACTURERS)],
+        'device_type': DEVICE_TYPES[index % len(DEVICE_TYPES)],
+        'serial': f"SN{index * 7919 % 10000000:07d}",
+        'site_name': f"Site{index % SITE_COUNT:03d}",
+        'status': STATUSES[index % len(STATUSES)],
+        'role': ROLES[index % len(ROLES)],
+    }
+
+
+def generate_devices_csv(path, rows):
+    """
+    Write a devices CSV with the given number of rows, reusing an existing file of the same size.
+    """
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            if sum(1 for _ in f) == rows + 1:
+                return path
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        for index in range(rows):
+            writer.writerow(device_row(index))
+    return path
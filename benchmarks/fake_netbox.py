@@ -0,0 +1,256 @@
+"""
+In-process stand-in for a pynetbox API, used by the benchmarks.
+
+It is configured in YAML exactly like pynetbox:
+
+    netbox:
+      type: api
+      module: benchmarks.fake_netbox
+      auth_method: token
+      auth_function: api
+      auth_args:
+        token: unused
+      base_urls:
+        - http://fake-netbox
+
+Endpoints (api.<app>.<endpoint>) support filter/all/get/create/update/delete with
+pynetbox-like return types, an optional simulated per-request latency, and count
+every request so benchmarks can report API calls per endpoint.
+"""
+import itertools
+import random
+import threading
+import time
+import types
+
+_settings = {'latency_ms': 0.0, 'jitter_ms': 0.0}
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def configure(latency_ms=0.0, jitter_ms=0.0):
+    """
+    Set the simulated latency applied to every request.
+    """
+    _settings['latency_ms'] = latency_ms
+    _settings['jitter_ms'] = jitter_ms
+
+
+def reset():
+    """
+    Drop all fake NetBox instances and their data.
+    """
+    with _instances_lock:
+        _instances.clear()
+
+
+def instance(base_url):
+    """
+    Return the shared fake NetBox for base_url, creating it if needed.
+    """
+    with _instances_lock:
+        api_instance = _instances.get(base_url)
+        if api_instance is None:
+            api_instance = _instances[base_url] = FakeNetBox(base_url)
+        return api_instance
+
+
+def api(base_url, token=None, **kwargs):
+    """
+    pynetbox.api() equivalent; instances are shared per base_url so tests can preload data.
+    """
+    return instance(base_url)
+
+
+def _simulate_latency():
+    latency = _settings['latency_ms']
+    if _settings['jitter_ms']:
+        latency += random.uniform(0, _settings['jitter_ms'])
+    if latency > 0:
+        time.sleep(latency / 1000)
+
+
+class Record:
+    """
+    Minimal pynetbox Record: attribute access to fields plus serialize().
+    """
+    def __init__(self, endpoint, data):
+        self._endpoint = endpoint
+        self.__dict__.update(data)
+
+    def serialize(self):
+        return {key: (value.id if isinstance(value, Record) else value)
+                for key, value in self.__dict__.items() if not key.startswith('_')}
+
+    def __iter__(self):
+        return iter(self.serialize().items())
+
+    def __str__(self):
+        return str(getattr(self, 'name', None) or getattr(self, 'id', ''))
+
+    def __repr__(self):
+        return f"Record({self.serialize()!r})"
+
+
+class RecordSet:
+    """
+    Lazy result of filter()/all(): the request only happens when it is iterated.
+    """
+    def __init__(self, endpoint, filters):
+        self._endpoint = endpoint
+        self._filters = filters
+
+    def __iter__(self):
+        return iter(self._endpoint._query(self._filters))
+
+
+class Endpoint:
+    def __init__(self, api_instance, name):
+        self.api = api_instance
+        self.name = name
+        self.records = {}
+        # field -> value -> {id: record}, built lazily for fields that are filtered on
+        self._indexes = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self.calls = {}
+
+    def _count(self, method):
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+    def _index(self, field):
+        index = self._indexes.get(field)
+        if index is None:
+            index = {}
+            for record in self.records.values():
+                index.setdefault(self._key(getattr(record, field, None)), {})[record.id] = record
+            self._indexes[field] = index
+        return index
+
+    @staticmethod
+    def _key(value):
+        if isinstance(value, Record):
+            return value.id
+        if isinstance(value, (list, dict)):
+            return repr(value)
+        return value
+
+    def _reindex(self, record, old_values=None):
+        for field, index in self._indexes.items():
+            if old_values is not None and field in old_values:
+                index.get(self._key(old_values[field]), {}).pop(record.id, None)
+            index.setdefault(self._key(getattr(record, field, None)), {})[record.id] = record
+
+    def _query(self, filters):
+        # Sleep outside the lock: concurrent requests to one endpoint overlap like real ones
+        _simulate_latency()
+        with self._lock:
+            self._count('request')
+            if not filters:
+                return list(self.records.values())
+            candidates = None
+            for field, value in filters.items():
+                # pynetbox style foo_id=<int> filters match the related object's id
+                if field.endswith('_id') and field != 'id':
+                    field = field[:-3]
+                matches = self._index(field).get(self._key(value), {})
+                candidates = dict(matches) if candidates is None else {k: v for k, v in candidates.items() if k in matches}
+                if not candidates:
+                    return []
+            return list(candidates.values())
+
+    def filter(self, **filters):
+        self._count('filter')
+        return RecordSet(self, filters)
+
+    def all(self):
+        self._count('all')
+        return RecordSet(self, {})
+
+    def get(self, id=None, **filters):
+        self._count('get')
+        if id is not None:
+            _simulate_latency()
+            with self._lock:
+                return self.records.get(id)
+        found = list(self._query(filters))
+        return found[0] if found else None
+
+    def create(self, data):
+        self._count('create')
+        _simulate_latency()
+        with self._lock:
+            if isinstance(data, list):
+                return [self._create_one(entry) for entry in data]
+            return self._create_one(data)
+
+    def _create_one(self, data):
+        record = Record(self, dict(data, id=next(self._ids)))
+        self.records[record.id] = record
+        self._reindex(record)
+        return record
+
+    def update(self, objects):
+        self._count('update')
+        _simulate_latency()
+        with self._lock:
+            updated = []
+            for data in objects:
+                record = self.records[data['id']]
+                old_values = {key: getattr(record, key, None) for key in data}
+                record.__dict__.update(data)
+                self._reindex(record, old_values)
+                updated.append(record)
+            return updated
+
+    def delete(self, objects):
+        self._count('delete')
+        _simulate_latency()
+        with self._lock:
+            for obj in objects:
+                record = self.records.pop(getattr(obj, 'id', obj), None)
+                if record is not None:
+                    for field, index in self._indexes.items():
+                        index.get(self._key(getattr(record, field, None)), {}).pop(record.id, None)
+            return True
+
+
+class App:
+    def __init__(self, api_instance, name):
+        self._api = api_instance
+        self._name = name
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        with self._lock:
+            endpoint = self._endpoints.get(name)
+            if endpoint is None:
+                endpoint = self._endpoints[name] = Endpoint(self._api, f"{self._name}.{name}")
+            return endpoint
+
+
+class FakeNetBox:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.http_session = types.SimpleNamespace(verify=True, headers={})
+        self._apps = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        with self._lock:
+            app = self._apps.get(name)
+            if app is None:
+                app = self._apps[name] = App(self, name)
+            return app
+
+    def call_counts(self):
+        """
+        Requests per endpoint and method, e.g. {'dcim.devices': {'filter': 10, 'request': 10}}.
+        """
+        return {endpoint.name: dict(endpoint.calls)
+                for app in self._apps.values() for endpoint in app._endpoints.values() if endpoint.calls}
@@ -0,0 +1,199 @@
+"""
+Micro-benchmarks for the engine's hot functions, parameterised by template complexity
+and object depth. Results are stored per commit so regressions show up locally:
+
+    python -m benchmarks.micro                      # run and save benchmarks/results/micro-<commit>.json
+    python -m benchmarks.micro --compare HEAD~1     # compare with the results saved for another commit
+    python -m benchmarks.micro --filter render      # only benchmarks whose name contains 'render'
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import timeit
+import types
+
+import deepdiff
+
+import data_transfer_tool
+from benchmarks import fake_netbox
+from utils.log import setup_logging
+from utils.resolver import Resolver
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def nested_object(depth, leaf='value'):
+    """
+    Attribute chain a.b.c... of the given depth, like an SDK object (e.g. summary.config.name).
+    """
+    obj = leaf
+    for level in reversed(range(depth)):
+        obj = types.SimpleNamespace(**{f"l{level}": obj, 'name': f"level{level}"})
+    return obj
+
+
+def dotted_path(depth):
+    return '.'.join(f"l{level}" for level in range(depth))
+
+
+def make_tool(workdir):
+    config_path = os.path.join(workdir, 'micro_config.yaml')
+    with open(config_path, 'w') as f:
+        f.write("api_definitions: {}\nobject_mappings: {}\n")
+    return data_transfer_tool.DataTransferTool(
+        config_path, False, False, watermark_file=os.path.join(workdir, 'watermarks.json')
+    )
+
+
+def build_benchmarks(tool):
+    """
+    Return {name: zero-argument callable}.
+    """
+    benchmarks = {}
+    row = {'device_name': 'Switch01 Core', 'manufacturer': 'Cisco Systems', 'serial': 'ABC123', 'site_name': 'SiteA'}
+
+    # Template rendering, by template complexity
+    templates = {
+        'simple': "<< device_name >>",
+        'filter': "<< device_name | slugify >>",
+        'regex_filter': "<< device_name | regex_replace('\\\\s+', '-') >>",
+        'multi_field': "<< device_name >>-<< serial >>-<< site_name | lower >>",
+        'conditional': "<< device_name if serial else site_name >>",
+    }
+    for name, template in templates.items():
+        benchmarks[f"render_template[{name}]"] = lambda template=template: tool._render_template(template, row)
+
+    # Template rendering and Resolver pre-resolution, by object depth
+    for depth in (1, 3, 5):
+        context = {'obj': nested_object(depth)}
+        path = f"obj.{dotted_path(depth)}"
+        template = f"<< {path} >>"
+        benchmarks[f"render_template[depth={depth}]"] = lambda template=template, context=context: tool._render_template(template, context)
+        benchmarks[f"resolver_pre_resolve[depth={depth}]"] = lambda path=path, context=context: Resolver(context, required_keys=[path])
+        keys = [path] + [f"obj.{dotted_path(level)}.name" if level else "obj.name" for level in range(depth)]
+        benchmarks[f"resolver_pre_resolve[depth={depth},keys={len(keys)}]"] = lambda keys=keys, context=context: Resolver(context, required_keys=keys)
+
+    # Transform actions
+    transforms = {
+        'regex_replace': ["regex_replace('\\s+', '-')"],
+        'listify': ['listify'],
+        'exclude': ["exclude('Switch01 Core')"],
+        'regex_replace+listify': ["regex_replace('[^A-Za-z0-9]', '')", 'listify'],
+    }
+    for name, actions in transforms.items():
+        benchmarks[f"apply_transform[{name}]"] = lambda actions=actions: tool.apply_transform_function(
+            'Switch01 Core', actions, {}, None, 'name', {}, row
+        )
+
+    # normalize_types and sanitize_data, by payload size and nesting
+    for fields, depth in ((5, 1), (20, 1), (20, 3)):
+        payload = {f"field{index}": str(index) if index % 2 else f"value{index}" for index in range(fields)}
+        nested = payload
+        for _ in range(depth - 1):
+            nested = dict(payload, child=nested, items=[dict(payload) for _ in range(3)])
+        benchmarks[f"normalize_types[fields={fields},depth={depth}]"] = lambda nested=nested: tool.normalize_types(nested)
+        records = dict(payload, site=types.SimpleNamespace(id=1, name='SiteA'), role=types.SimpleNamespace(name='Switch'))
+        benchmarks[f"sanitize_data[fields={fields}]"] = lambda records=records: tool.sanitize_data(records)
+
+    # The DeepDiff comparison of create_or_update, and the full find+diff path against the fake NetBox
+    for fields in (5, 20):
+        current = {f"field{index}": index for index in range(fields)}
+        mapped = {f"field{index}": str(index) for index in range(fields)}
+        benchmarks[f"deepdiff[fields={fields}]"] = lambda current=current, mapped=mapped: deepdiff.DeepDiff(
+            current, tool.normalize_types(mapped), ignore_order=True, report_repetition=True,
+            ignore_type_in_groups=[(int, str, float)]
+        )
+
+    fake_netbox.reset()
+    netbox = fake_netbox.instance('http://fake-netbox')
+    netbox.dcim.devices.create({'name': 'Switch01', 'serial': 'ABC123', 'status': 'active', 'site': 1})
+    mapped_device = {'name': 'Switch01', 'serial': 'ABC123', 'status': 'active', 'site': 1}
+    benchmarks["create_or_update[existing,no_change]"] = lambda: tool.create_or_update(
+        netbox, 'dcim.devices.filter', 'dcim.devices.create', 'dcim.devices.update', dict(mapped_device)
+    )
+    return benchmarks
+
+
+def measure(func, repeat=5, min_time=0.2):
+    """
+    Median time per call in microseconds over repeat rounds of at least min_time seconds.
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    rounds = [timer.timeit(number) / number * 1e6 for _ in range(repeat)]
+    return {'median_us': statistics.median(rounds), 'min_us': min(rounds), 'number': number}
+
+
+def git_revision(ref='HEAD'):
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', ref], capture_output=True, text=True, check=True).stdout.strip()
+        if ref == 'HEAD':
+            dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True).stdout.strip()
+            if dirty:
+                revision += '-dirty'
+        return revision
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def results_path(revision):
+    return os.path.join(RESULTS_DIR, f"micro-{revision}.json")
+
+
+def load_baseline(compare):
+    path = compare if os.path.exists(compare) else results_path(git_revision(compare) or compare)
+    with open(path, 'r') as f:
+        return path, json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for rendering, resolving, transforms and diffing')
+    parser.add_argument('--filter', help='Only run benchmarks whose name contains this text')
+    parser.add_argument('--repeat', type=int, default=5, help='Measurement rounds per benchmark')
+    parser.add_argument('--min-time', type=float, default=0.2, help='Minimum seconds per measurement round')
+    parser.add_argument('--compare', help='Commit (or results file) to compare against')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Percent slowdown reported as a regression')
+    parser.add_argument('--no-save', action='store_true', help="Don't store the results")
+    args = parser.parse_args()
+
+    setup_logging('ERROR', queued=False)
+    workdir = tempfile.mkdtemp(prefix='nbsync-micro-')
+    benchmarks = build_benchmarks(make_tool(workdir))
+
+    results = {}
+    for name, func in benchmarks.items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(func, args.repeat, args.min_time)
+        print(f"{name:<55} {results[name]['median_us']:>12.2f} us")
+
+    revision = git_revision()
+    if not args.no_save and revision:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        with open(results_path(revision), 'w') as f:
+            json.dump({'revision': revision, 'results': results}, f, indent=2)
+        print(f"\nSaved results to {results_path(revision)}")
+
+    if args.compare:
+        baseline_path, baseline = load_baseline(args.compare)
+        print(f"\nComparison with {baseline.get('revision')} ({baseline_path}):")
+        regressions = 0
+        for name, result in results.items():
+            previous = baseline['results'].get(name)
+            if not previous:
+                continue
+            change = (result['median_us'] - previous['median_us']) / previous['median_us'] * 100
+            marker = 'REGRESSION' if change > args.threshold else ''
+            regressions += bool(marker)
+            print(f"{name:<55} {previous['median_us']:>10.2f} -> {result['median_us']:>10.2f} us {change:>+7.1f}% {marker}")
+        if regressions:
+            raise SystemExit(f"{regressions} benchmark(s) slower by more than {args.threshold}%")
+
+
+if __name__ == '__main__':
+    main()
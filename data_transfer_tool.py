@@ -4,14 +4,36 @@ import yaml
 import re
 import os
 import argparse
-from sources.api_source import APIDataSource
-from sources.csv_source import CSVDataSource
-from sources.xls_source import XLSDataSource
-from sources.snmp_source import SNMPDataSource
+import contextvars
+import datetime
+import hashlib
+import marshal
+import multiprocessing
+import threading
+from collections import ChainMap, Counter
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import Mapping
+from sources.registry import get_source_class
 import jinja2
-import deepdiff
+import jinja2.meta
+from jinja2 import nodes
+from utils.api_stats import ApiCallStats
+from utils.dead_letter import DeadLetterQueue
+from utils.checkpoint import CheckpointStore, default_checkpoint_path
+from utils.config_cache import ConfigCache
+from utils.log import get_logger, setup_logging
+from utils.profiler import RunProfiler
+from utils.rate_limit import AdaptiveLimiter
 from utils.timer import Timer
-from utils.resolver import Resolver
+from utils.replace_map import load_replace_map
+from utils.resolver import Resolver, ResolutionCache
+from utils.retry import RetryPolicy
+from utils.coordinator import Coordinator, parse_shard
+from utils.pipeline import Pipeline, SequenceTracker, Stage
+from utils.plan import AppliedLog, ChangePlan, is_ref, plan_batches, resolve_refs
+from utils.sharding import LookupRef, SharedLookupStore, ShardedRun, key_hash, shard_key, shard_of
+from utils.snapshot import SnapshotCache
+from utils.watermark import WatermarkStore, max_watermark, watermark_field
 
 # Custom Jinja2 filters
 def regex_replace(value, pattern, replacement):
@@ -40,24 +62,69 @@ def replace_map(value, filename):
     """
     Apply a series of regex replacements from a file to the value.
     Each line in the file should be in the format: pattern,replacement
+    The file is parsed and compiled once and reloaded only when its mtime changes.
     """
     try:
-        with open(filename, 'r') as f:
-            # Read the file line by line
-            for line in f:
-                # Split each line into pattern and replacement
-                pattern, replacement = line.strip().split(',')
-                # Apply the regex replacement
-                value = re.sub(pattern, replacement, value)
-        #print(f"after replace_map {value}")
-        return value
+        return load_replace_map(filename).apply(value)
     except Exception as e:
-        print(f"Error in replace_map: {e}")
+        logger.error("Error in replace_map: %s", e)
         return value  # Return the value unchanged in case of an error
 
-    
+
+# Per-item resolution cache of the object currently being rendered (see process_single_mapping)
+_active_resolution_cache = contextvars.ContextVar('active_resolution_cache', default=None)
+_ATTR_MISS = object()
+
+class CachingEnvironment(jinja2.Environment):
+    """
+    Jinja2 environment whose attribute lookups go through the per-item resolution cache,
+    so `{{ vm.runtime.powerState }}` doesn't re-fetch lazy SDK properties for every field.
+    """
+    def getattr(self, obj, attribute):
+        cache = _active_resolution_cache.get()
+        if cache is None or isinstance(obj, (dict, Mapping)):
+            return super().getattr(obj, attribute)
+        value = cache.getattr(obj, attribute, _ATTR_MISS)
+        if value is _ATTR_MISS:
+            return super().getattr(obj, attribute)
+        return value
+
+def _load_path(node):
+    """
+    Dotted path read by a chain of attribute and constant item lookups on a variable
+    ('vm.runtime.powerState'), or None for any other expression.
+    """
+    parts = []
+    while True:
+        if isinstance(node, nodes.Getattr):
+            parts.append(node.attr)
+        elif isinstance(node, nodes.Getitem) and isinstance(node.arg, nodes.Const) and isinstance(node.arg.value, str):
+            parts.append(node.arg.value)
+        elif isinstance(node, nodes.Name) and node.ctx == 'load':
+            parts.append(node.name)
+            return '.'.join(reversed(parts))
+        else:
+            return None
+        node = node.node
+
+
+def _collect_paths(node, paths):
+    if isinstance(node, nodes.Call) and isinstance(node.node, nodes.Getattr):
+        # A method call (e.g. `name.split(...)`) reads the object, not the method
+        _collect_paths(node.node.node, paths)
+        for child in node.iter_child_nodes(exclude=('node',)):
+            _collect_paths(child, paths)
+        return
+    path = _load_path(node) if isinstance(node, (nodes.Name, nodes.Getattr, nodes.Getitem)) else None
+    if path is not None:
+        paths.append(path)
+        return
+    for child in node.iter_child_nodes():
+        _collect_paths(child, paths)
+
+
 # Create a new Jinja2 environment and add the filters
-env = jinja2.Environment(loader=jinja2.FileSystemLoader('./'))
+env = CachingEnvironment(loader=jinja2.FileSystemLoader('./'))
 env.filters['regex_replace'] = regex_replace
 env.filters['slugify'] = slugify
 env.filters['extract_item'] = extract_item
@@ -77,12 +144,53 @@ def env_var_constructor(loader, node):
     
     return value
 
+# Run-wide span timer, reported at the end of main()
+timer = Timer(True)
+logger = get_logger()
+
 env_var_pattern = re.compile(r'\$\{([^}^{]+)\}')
 yaml.add_implicit_resolver('!envvar', env_var_pattern)
 yaml.add_constructor('!envvar', env_var_constructor)
 
+# PyYAML's C loader when it was built with libyaml
+_SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+def parse_config(yaml_content):
+    """
+    Parse config text whose templates are escaped and environment already expanded.
+    Unset ${VAR} references are left to FullLoader's !envvar resolver to report; any
+    other config goes through the (much faster) safe loader.
+    """
+    if not env_var_pattern.search(yaml_content):
+        try:
+            return yaml.load(yaml_content, Loader=_SafeLoader)
+        except yaml.constructor.ConstructorError:
+            # Python-specific tags, which only FullLoader constructs
+            pass
+    return yaml.load(yaml_content, Loader=yaml.FullLoader)
+
+def _template_strings(structure):
+    """
+    Every (escaped) template string in an object_mappings structure.
+    """
+    if isinstance(structure, dict):
+        for value in structure.values():
+            yield from _template_strings(value)
+    elif isinstance(structure, list):
+        for value in structure:
+            yield from _template_strings(value)
+    elif isinstance(structure, str) and '<<' in structure:
+        yield structure
+
 class DataTransferTool:
-    def __init__(self, yaml_file, dry_run, debug):
+    def __init__(self, yaml_file, dry_run, debug, watermark_file=None, full_sync=False, config_cache=None):
+        self.yaml_file = yaml_file
+
+        # Compiled field templates by template string, and marshalled code objects of the
+        # mapping templates (from the config cache) to build them from without compiling
+        self._templates = {}
+        self._template_code = {}
+
         # Read the YAML file line by line and build yaml_content until object_mappings
         yaml_content = []
         object_mappings = []
@@ -90,14 +198,28 @@ class DataTransferTool:
         with open(yaml_file, 'r') as file:
             yaml_content = file.read()
 
-        #replace jinjas {{}} with <<>> so it wont parse them yet.
-        yaml_content = yaml_content.replace('{{', '<<').replace('}}', '>>')
-        yaml_content = yaml_content.replace('{%', '#<<')
-        # Substitute environment variables in the YAML content
-        yaml_content = os.path.expandvars(yaml_content)
-
-        # Load the YAML content (excluding object_mappings) into self.config
-        self.config = yaml.load(yaml_content, Loader=yaml.FullLoader)
+        # --config-cache: reuse the parsed config and compiled templates of an unchanged file
+        self.config_cache = config_cache
+        cache = ConfigCache(config_cache) if config_cache else None
+        cache_key = cache.key(yaml_content, (yaml.__version__, jinja2.__version__)) if cache else None
+        cached = cache.load(cache_key) if cache else None
+        if cached is not None:
+            self.config = cached['config']
+            self._template_code = cached['templates']
+            logger.debug("Loaded %s from the config cache", yaml_file)
+        else:
+            #replace jinjas {{}} with <<>> so it wont parse them yet.
+            yaml_content = yaml_content.replace('{{', '<<').replace('}}', '>>')
+            yaml_content = yaml_content.replace('{%', '#<<')
+            # Substitute environment variables in the YAML content
+            yaml_content = os.path.expandvars(yaml_content)
+
+            # Load the YAML content (excluding object_mappings) into self.config
+            self.config = parse_config(yaml_content)
+            self._validate_config()
+            if cache:
+                self._template_code = self._compile_mapping_templates()
+                cache.store(cache_key, {'config': self.config, 'templates': self._template_code})
 
         # Keep the object_mappings section as a string (to be rendered later)
         self.raw_object_mappings = ''.join(object_mappings)
@@ -111,43 +233,228 @@ class DataTransferTool:
         self.DEBUG = 1
         self.lookup_cache = {}
 
-    def initialize_sources(self):
+        # Per-endpoint accounting of destination API calls, and the instrumented callables;
+        # request payload sizes are only measured with --debug, --profile or --api-stats
+        self.api_stats = ApiCallStats(measure_payloads=debug)
+        self._function_cache = {}
+
+        # One AdaptiveLimiter per destination base_url, shared by all its API functions
+        self.rate_limiters = {}
+
+        # Objects that still fail after retries are written here instead of aborting the run
+        self.dead_letters = DeadLetterQueue(self.config.get('dead_letter_file', 'nbsync_failed.jsonl'))
+        self.failures = Counter()
+
+        # --processes: root mappings are sharded over worker processes that share lookups
+        self.processes = 1
+        self.worker_options = {}
+        self.shared_lookups = None
+
+        # --shard i/N: this host only processes the items of one shard (see utils/coordinator.py)
+        self.coordinator = None
+
+        # --pipeline: {'queue_size', 'render_workers', 'lookup_workers', 'write_workers'};
+        # lookups and failure counts are then updated from several threads
+        self.pipeline_options = None
+        self._lookup_locks = {}
+        self._lookup_locks_guard = threading.Lock()
+        self._failures_lock = threading.Lock()
+
+        # Nested items of one parent are prepared by up to nested_workers threads and
+        # written nested_batch_size at a time once the parent id is known (1 = serial)
+        self.nested_workers = 8
+        self.nested_batch_size = 50
+
+        # Keys of the objects each mapping with `prune` wrote in this run: {obj_type: set()}
+        self.seen_keys = {}
+
+        # --plan: a dry run that records its changes in a ChangePlan instead of logging them.
+        # Planned creates are indexed by key and by single field, so repeated rows and
+        # lookups refer to the same planned object instead of creating it again
+        self.plan = None
+        self._planned_creates = {}
+        self._plan_lock = threading.Lock()
+        # Existing destination objects listed once per endpoint and key fields while
+        # planning: {(client, endpoint, key_fields): {key values: object}}
+        self._destination_index = {}
+        self._destination_index_lock = threading.Lock()
+
+        # Optional RunProfiler; takes a memory snapshot at each object_mapping boundary
+        self.profiler = None
+
+        # Directory to dump fetched source data to as Parquet (all mappings, or per
+        # mapping with `dump_parquet: true`/`<dir>` in the object_mapping)
+        self.dump_dir = self.config.get('dump_parquet')
+
+        # Optional SnapshotCache of fetch_data results (--cache-sources / --replay)
+        self.snapshots = None
+
+        # Optional CheckpointStore (--checkpoint-every / --resume), and the ids of objects
+        # created so far, recorded with each checkpoint
+        self.checkpoints = None
+        self.created_ids = []
+
+        # High-water marks for incremental fetching, persisted between runs
+        self.full_sync = full_sync
+        self.watermarks = WatermarkStore(
+            watermark_file or self.config.get('watermark_file', '.nbsync_watermarks.json')
+        )
+
+    def _validate_config(self):
+        """
+        Fail early on object_mappings (or nested mappings) that refer to an undefined API.
+        """
+        definitions = self.config.get('api_definitions') or {}
+
+        def check(obj_type, obj_config):
+            for key in ('source_api', 'destination_api'):
+                name = obj_config.get(key)
+                if name and name not in definitions:
+                    raise ValueError(f"object_mapping {obj_type}: {key} '{name}' is not defined in api_definitions")
+            nested_mappings = (obj_config.get('mapping') or {}).get('nested_mappings') or {}
+            for nested_obj_type, nested_obj_config in nested_mappings.items():
+                check(nested_obj_type, nested_obj_config)
+
+        for obj_type, obj_config in (self.config.get('object_mappings') or {}).items():
+            check(obj_type, obj_config)
+
+    def _compile_mapping_templates(self):
+        """
+        Compile every template of the object_mappings to marshalled code, for the config cache.
+        """
+        template_code = {}
+        for template_str in _template_strings(self.config.get('object_mappings') or {}):
+            if template_str in template_code:
+                continue
+            try:
+                code = env.compile(template_str.replace('<<', '{{').replace('>>', '}}'))
+            except jinja2.TemplateError:
+                # Reported when the template is rendered
+                continue
+            template_code[template_str] = marshal.dumps(code)
+        return template_code
+
+    def _compiled_template(self, template_str):
+        """
+        (jinja2.Template, required keys) of a template string, compiled once per run.
+        """
+        compiled = self._templates.get(template_str)
+        if compiled is None:
+            source = template_str.replace('<<', '{{').replace('>>', '}}')
+            code = self._template_code.get(template_str)
+            if code is not None:
+                template = env.template_class.from_code(env, marshal.loads(code), env.make_globals(None))
+            else:
+                template = env.from_string(source)
+            compiled = self._templates[template_str] = (template, self.extract_required_keys(source))
+        return compiled
+
+    def _used_source_names(self, destinations_only=False):
+        """
+        Names of the api_definitions referenced by object_mappings (including nested
+        mappings); definitions that no mapping uses are never imported or authenticated.
+        With destinations_only (replaying failures), source APIs are left out too.
+        """
+        used = set()
+
+        def collect(obj_config):
+            for key in ('destination_api',) if destinations_only else ('source_api', 'destination_api'):
+                if obj_config.get(key):
+                    used.add(obj_config[key])
+            nested_mappings = (obj_config.get('mapping') or {}).get('nested_mappings') or {}
+            for nested_obj_config in nested_mappings.values():
+                collect(nested_obj_config)
+
+        for obj_config in (self.config.get('object_mappings') or {}).values():
+            collect(obj_config)
+        return used
+
+    def initialize_sources(self, destinations_only=False):
+        used = self._used_source_names(destinations_only)
         for name, config in self.config['api_definitions'].items():
-            
-            source_type = config['type']
-            if source_type == 'api' or source_type == 'api-swagger':
-                self.sources[name] = APIDataSource(name, config)
-            elif source_type == 'csv':
-                self.sources[name] = CSVDataSource(name, config)
-            elif source_type == 'xls':
-                self.sources[name] = XLSDataSource(config)
-            elif source_type == 'snmp':
-                self.sources[name] = SNMPDataSource(config)
+            if name not in used:
+                logger.debug("Skipping unused source %s", name)
+                continue
+
+            # The source module (and its SDK dependencies) is imported on first use
+            source_class = get_source_class(config['type'])
+            self.sources[name] = source_class(name, config)
             
             self.sources[name].authenticate()
 
     def extract_required_keys(self,template_string):
         """
-        Extract keys referenced in a Jinja template.
+        Extract the source paths a Jinja template reads, from every expression (conditions,
+        filter arguments, loops), e.g. ['vm.name', 'vm.runtime.powerState', 'site'].
+        Loop and `set` variables and Jinja globals are not source paths.
         """
-        key_pattern = r"{{[\s\(\[]*([\w\.]+)"
-        return re.findall(key_pattern, template_string)
+        source = template_string.replace('<<', '{{').replace('>>', '}}')
+        try:
+            ast = env.parse(source)
+        except jinja2.TemplateSyntaxError:
+            # Reported when the template is compiled
+            return []
+        undeclared = jinja2.meta.find_undeclared_variables(ast) - set(env.globals)
+        paths = []
+        _collect_paths(ast, paths)
+        return list(dict.fromkeys(path for path in paths if path.split('.', 1)[0] in undeclared))
 
     
-    def _render_template(self, template_str, context):
+    def _mapping_required_keys(self, obj_config, include_nested=False):
+        """
+        Collect the keys referenced by all field templates of an object_mapping.
+        With include_nested, keys of nested_mappings are added prefixed with the
+        nested collection name (e.g. 'interfaces.name'), relative to the root item.
+        """
+        required_keys = set()
+        mappings = obj_config.get('mapping', {}) or {}
+        for dest_field, field_info in mappings.items():
+            if dest_field == 'nested_mappings' or not isinstance(field_info, dict):
+                continue
+            source_template = field_info.get('source')
+            if isinstance(source_template, str):
+                source_template = source_template.replace('<<', '{{').replace('>>', '}}')
+                required_keys.update(self.extract_required_keys(source_template))
+
+        if include_nested:
+            for nested_obj_type, nested_obj_config in (mappings.get('nested_mappings') or {}).items():
+                required_keys.add(nested_obj_type)
+                for key in self._mapping_required_keys(nested_obj_config, include_nested=True):
+                    required_keys.add(f"{nested_obj_type}.{key}")
+
+        # parent_id is injected into the context by the tool, it never comes from the source
+        required_keys.discard('parent_id')
+        return required_keys
+
+    def _projection_fields(self, obj_config):
+        """
+        Minimal set of source properties an object_mapping needs, passed to sources as
+        a projection hint. Mappings can opt out with `projection: false`.
+        """
+        if obj_config.get('projection', True) is False:
+            return None
+        fields = self._mapping_required_keys(obj_config, include_nested=True)
+        field = watermark_field(obj_config)
+        if field and field != 'mtime':
+            fields.add(field)
+        return sorted(fields) or None
+
+    def _render_template(self, template_str, context, cache=None):
         """
         Render a Jinja2 template string with the given context.
+        An optional ResolutionCache is shared with the Resolver and Jinja attribute lookups.
         """
+        token = _active_resolution_cache.set(cache)
         try:
-            template_str = template_str.replace('<<', '{{').replace('>>', '}}')
-            required_keys=self.extract_required_keys(template_str)
-            resolver = Resolver(context, required_keys=required_keys)
-            template = env.from_string(template_str)
+            template, required_keys = self._compiled_template(template_str)
+            resolver = Resolver(context, required_keys=required_keys, cache=cache)
             rendered_template = template.render(resolver)
             return rendered_template
         except Exception as e:
-            print(f"Error rendering template '{template_str}': {e}")
+            logger.error("Error rendering template '%s': %s", template_str, e)
             return None
+        finally:
+            _active_resolution_cache.reset(token)
         
     def _render_nested_structure(self, structure, context):
         """
@@ -177,124 +484,731 @@ class DataTransferTool:
     def process_mappings(self):
         """Process the mappings defined in the object_mappings section of the YAML."""
         for obj_type, obj_config in self.config['object_mappings'].items():
-            timer.start_timer(f"Total {obj_type} Runtime")
             source = self.sources[obj_config['source_api']]
 
-            for source_client in source.clients:
-                source_api = obj_config.get('source_api')
-                destination_api = self.sources[obj_config['destination_api']]
-
-                # Fetch root-level data
-                timer.start_timer(f"Fetch Data {obj_type} {source_api}")
-                if self.debug: print(f"Fetching {obj_type} from {source_api}...")
-                source_data = source.fetch_data(obj_config, source_client)
-                timer.stop_timer(f"Fetch Data {obj_type} {source_api}")
-
-                # Process each root-level object
-                for item in source_data:
-                    self.process_single_mapping(obj_type, obj_config, destination_api, item)
+            # Distributed run: referenced objects must exist on every shard first
+            if self.coordinator and obj_config.get('depends_on'):
+                depends_on = obj_config['depends_on']
+                with timer.span("Wait for Shards", obj_type=obj_type):
+                    self.coordinator.wait_for([depends_on] if isinstance(depends_on, str) else depends_on)
+            host_shard = self.coordinator.shard if self.coordinator else None
+            key_paths = self._shard_key_paths(obj_config) if self.coordinator or self.pipeline_options else None
+
+            # Pruning needs every key of the source, so any partial view of it disables it
+            prune_blocked = None
+            if obj_config.get('prune') and self.coordinator:
+                prune_blocked = "the run is split across hosts"
+            failures_before = self.failures[obj_type]
+
+            with timer.span("Mapping", obj_type=obj_type):
+                for client_index, source_client in enumerate(source.clients):
+                    source_api = obj_config.get('source_api')
+                    destination_api = self.sources[obj_config['destination_api']]
+                    client_key = self._client_key(source_client, client_index)
+                    if self.coordinator:
+                        # Watermarks and checkpoints only cover this host's shard
+                        client_key = f"{client_key}#{host_shard}/{self.coordinator.total}"
+                    watermark_key = WatermarkStore.key(obj_type, source_api, client_key)
+
+                    # Resumed run: skip finished clients and already processed items
+                    progress = self.checkpoints.get(watermark_key) if self.checkpoints else {}
+                    if progress.get('done'):
+                        logger.info("Skipping %s from %s client %s: completed in the interrupted run", obj_type, source_api, client_key)
+                        prune_blocked = prune_blocked or "the run was resumed"
+                        continue
+                    resume_offset = progress.get('offset', 0)
+                    if resume_offset:
+                        prune_blocked = prune_blocked or "the run was resumed"
+
+                    # Incremental mode: hand the stored watermark to the source
+                    field = watermark_field(obj_config)
+                    fetch_hints = {}
+                    high_water_mark = None
+                    fields = self._projection_fields(obj_config)
+                    if fields:
+                        fetch_hints['fields'] = fields
+                    if field:
+                        since = None if self.full_sync else self.watermarks.get(watermark_key)
+                        fetch_hints['since'] = since
+                        if since is not None:
+                            prune_blocked = prune_blocked or "only changed rows were fetched (use --full-sync)"
+                        # Sources with their own watermark (e.g. file mtime) report it before fetching
+                        high_water_mark = max_watermark(
+                            source.get_watermark(obj_config, source_client), progress.get('high_water_mark')
+                        )
+                        logger.debug("Fetching %s changed since %s (watermark: %s)", obj_type, since, field)
+
+                    # Fetch root-level data
+                    logger.info("Fetching %s from %s...", obj_type, source_api)
+                    with timer.span("Fetch Data", obj_type=obj_type, source=source_api):
+                        from_snapshot = False
+                        if self.snapshots:
+                            source_data, from_snapshot = self.snapshots.fetch(
+                                source, obj_config, source_client, client_key, fetch_hints
+                            )
+                        else:
+                            source_data = source.fetch_data(obj_config, source_client, **fetch_hints)
+
+                    # Optionally bulk-fetch the property paths the templates need
+                    # (snapshot records are already detached from the source)
+                    prefetched = None
+                    if obj_config.get('prefetch') and not from_snapshot:
+                        source_data = list(source_data)
+                        with timer.span("Prefetch", obj_type=obj_type, source=source_api):
+                            prefetched = source.prefetch_properties(
+                                source_client, source_data, self._mapping_required_keys(obj_config)
+                            )
+
+                    # An offset only identifies the processed items if the source repeats its order
+                    if resume_offset and not (from_snapshot or source.stable_order or obj_config.get('stable_order')):
+                        logger.warning("Reprocessing all %s from %s client %s: the source does not return items in a stable "
+                                       "order, so the %s processed before the interruption cannot be skipped "
+                                       "(set stable_order: true on the mapping if it does)",
+                                       obj_type, source_api, client_key, resume_offset)
+                        resume_offset = 0
+
+                    dump_writer = self._dump_writer(obj_type, obj_config, client_index)
+                    if dump_writer:
+                        source_data = dump_writer.tee(source_data)
+
+                    if resume_offset:
+                        logger.info("Resuming %s from %s client %s after %s items", obj_type, source_api, client_key, resume_offset)
+                    created_from = len(self.created_ids)
+                    offset = checkpointed = resume_offset
+
+                    # Prefetched properties belong to the parent's session, so those mappings stay in-process
+                    processes = obj_config.get('processes', self.processes)
+                    # The plan file is written by this process only
+                    sharded = self._start_shards(obj_type, obj_config) if processes > 1 and not prefetched and self.plan is None else None
+                    pipeline = tracker = None
+                    if self.pipeline_options and not sharded:
+                        # Items finish out of order; only the contiguous prefix counts as done
+                        tracker = SequenceTracker(resume_offset)
+                        pipeline = self._start_pipeline(obj_type, obj_config, destination_api, tracker.complete)
+
+                    # Process each root-level object
+                    try:
+                        for index, item in enumerate(source_data):
+                            if index < resume_offset:
+                                continue
+                            if host_shard is not None and shard_of(shard_key(item, key_paths), self.coordinator.total) != host_shard:
+                                if tracker:
+                                    tracker.complete(index)
+                                continue
+                            item_prefetched = prefetched[index] if prefetched else None
+                            if sharded:
+                                sharded.submit(item)
+                            elif pipeline:
+                                pipeline.submit(index, key_hash(shard_key(item, key_paths)), (item, item_prefetched))
+                            else:
+                                self.process_single_mapping(obj_type, obj_config, destination_api, item, prefetched=item_prefetched)
+                            if field and field != 'mtime':
+                                high_water_mark = max_watermark(high_water_mark, Resolver(item).resolve(field))
+                            offset = index + 1
+                            # Sharded items are only known to be done once every worker has finished
+                            done = tracker.contiguous if tracker else offset
+                            if self.checkpoints and not sharded and done - checkpointed >= self.checkpoints.every:
+                                self.checkpoints.update(watermark_key, done, high_water_mark=high_water_mark,
+                                                        created=self.created_ids[created_from:])
+                                created_from = len(self.created_ids)
+                                checkpointed = done
+                        if sharded:
+                            self._merge_shard_results(sharded.finish())
+                        if pipeline:
+                            pipeline.finish()
+                    finally:
+                        if sharded:
+                            sharded.terminate()
+                        if pipeline:
+                            pipeline.abort()
+                        if dump_writer:
+                            dump_writer.close()
+
+                    if self.checkpoints:
+                        self.checkpoints.update(watermark_key, offset, done=True, high_water_mark=high_water_mark,
+                                                created=self.created_ids[created_from:])
+
+                    # Only advance the watermark once the whole batch has been processed
+                    # (a replayed snapshot says nothing about the source's current state)
+                    if field and not self.dry_run and not from_snapshot:
+                        self.watermarks.set(watermark_key, max_watermark(since, high_water_mark))
+                        self.watermarks.save()
+
+                if obj_config.get('prune'):
+                    if self.failures[obj_type] > failures_before:
+                        prune_blocked = prune_blocked or "some objects failed"
+                    if prune_blocked:
+                        logger.warning("Not pruning %s: %s", obj_type, prune_blocked)
+                    else:
+                        with timer.span("Prune", obj_type=obj_type):
+                            self.prune_orphans(obj_type, obj_config)
+
+            if self.coordinator:
+                self.coordinator.mapping_done(obj_type)
+            if self.profiler:
+                self.profiler.snapshot(f"after {obj_type}")
+
+        # Every mapping completed: the next run starts from scratch
+        if self.checkpoints:
+            self.checkpoints.clear()
+
+    def join_distributed_run(self, shard, coordinator_path, run_id=None):
+        """
+        Take part in a run split across hosts: claim shard ('i/N' or 'auto/N') from the
+        coordinator database and share lookups with the other hosts. The default run id
+        is derived from the config file and the date, so hosts started the same day with
+        the same config join the same run.
+        """
+        index, total = parse_shard(shard)
+        if run_id is None:
+            with open(self.yaml_file, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()[:12]
+            run_id = f"{digest}-{total}-{datetime.date.today().isoformat()}"
+        self.coordinator = Coordinator(coordinator_path, run_id, total)
+        self.coordinator.claim(index)
+        self.shared_lookups = self.coordinator.lookup_store()
+
+    def finish_distributed_run(self, failed=False):
+        """
+        Report this host's results to the coordinator and log the state of all shards.
+        """
+        results = {
+            'failures': dict(self.failures),
+            'created': len(self.created_ids),
+            'api_calls': sum(row['calls'] for row in self.api_stats.summary()),
+        }
+        self.coordinator.finish(results, failed=failed)
+        for row in self.coordinator.summary():
+            logger.info("Run %s shard %s on %s: %s %s", self.coordinator.run_id, row['shard'], row['host'],
+                        row['status'], row['results'] or '')
+
+    def _shard_key_paths(self, obj_config):
+        """
+        Source keys behind the key fields of a mapping (its first two mapped fields, see
+        create_or_update); items with equal values always go to the same worker.
+        """
+        fields = [info for field, info in (obj_config.get('mapping') or {}).items()
+                  if field != 'nested_mappings' and info and 'source' in info][:2]
+        keys = {key for info in fields for key in self.extract_required_keys(info['source'])}
+        keys.discard('parent_id')
+        return sorted(keys) or sorted(self._mapping_required_keys(obj_config))
 
-            timer.stop_timer(f"Total {obj_type} Runtime")
-            timer.show_timers()
+    def _start_shards(self, obj_type, obj_config):
+        """
+        Start the worker processes for one object_mapping.
+        """
+        processes = obj_config.get('processes', self.processes)
+        if self.shared_lookups is None:
+            self._manager = multiprocessing.get_context('spawn').Manager()
+            self.shared_lookups = SharedLookupStore(self._manager)
+        options = {
+            'config_file': self.yaml_file,
+            'dry_run': self.dry_run,
+            'debug': self.debug,
+            'dead_letter_file': self.dead_letters.path,
+            'log_level': 'DEBUG' if self.debug else 'INFO',
+            'log_json': False,
+            'nested_workers': self.nested_workers,
+            'nested_batch_size': self.nested_batch_size,
+            'config_cache': self.config_cache,
+            'measure_payloads': self.api_stats.measure_payloads,
+        }
+        options.update(self.worker_options)
+        logger.info("Sharding %s over %s worker processes", obj_type, processes)
+        return ShardedRun(
+            processes, options, obj_type, self._shard_key_paths(obj_config),
+            self._projection_fields(obj_config), self.shared_lookups
+        )
+
+    def _start_pipeline(self, obj_type, obj_config, destination_api, on_complete):
+        """
+        Start render -> lookup -> write stages for one object_mapping and source client;
+        the caller's fetch loop is the first stage.
+        """
+        options = self.pipeline_options
+
+        def render(payload):
+            item, prefetched = payload
+            with timer.span("Render", obj_type=obj_type):
+                rendered_mappings = self.render_item(obj_type, obj_config, item, prefetched=prefetched)
+            return None if rendered_mappings is None else (item, rendered_mappings)
+
+        def lookup(payload):
+            item, rendered_mappings = payload
+            mapped_data = self.transform_item(obj_type, obj_config, destination_api, item, rendered_mappings)
+            return None if mapped_data is None else (item, mapped_data)
+
+        def write(payload):
+            item, mapped_data = payload
+            self.write_item(obj_type, obj_config, destination_api, item, mapped_data)
+
+        return Pipeline([
+            Stage('render', render, options.get('render_workers', 1)),
+            Stage('lookup', lookup, options.get('lookup_workers', 4)),
+            Stage('write', write, options.get('write_workers', 4)),
+        ], queue_size=options.get('queue_size', 100), on_complete=on_complete).start()
+
+    def _merge_shard_results(self, results):
+        """
+        Add the timers, API statistics, failures and created ids of the workers to this run.
+        """
+        for result in results:
+            timer.merge(result['timer'])
+            self.api_stats.merge(result['api_stats'])
+            self.failures.update(result['failures'])
+            self.created_ids.extend(result['created_ids'])
+            for obj_type, keys in result['seen_keys'].items():
+                self.seen_keys.setdefault(obj_type, set()).update(keys)
+            logger.info("Worker %s processed %s items", result['worker'], result['processed'])
+
+    def _dump_writer(self, obj_type, obj_config, client_index):
+        """
+        ParquetDumpWriter for this mapping and client if dumping is enabled, else None.
+        Files are named <dir>/<obj_type>-<client index>.parquet.
+        """
+        dump_dir = obj_config.get('dump_parquet', self.dump_dir)
+        if dump_dir is True:
+            dump_dir = self.dump_dir or 'dumps'
+        if not dump_dir:
+            return None
+        from sources.parquet_source import ParquetDumpWriter
+        return ParquetDumpWriter(
+            os.path.join(dump_dir, f"{obj_type}-{client_index}.parquet"), self._projection_fields(obj_config)
+        )
 
+    def _client_key(self, client, index):
+        """
+        Stable identifier for a source client: file paths are used as-is, API clients by position.
+        """
+        return client if isinstance(client, str) else str(index)
 
-    def process_single_mapping(self, obj_type, obj_config, destination_api, item, parent_id=None):
+    def process_single_mapping(self, obj_type, obj_config, destination_api, item, parent_id=None, prefetched=None):
         """Process a single mapping including nested mappings."""
-        timer.start_timer(f"Per Object Timing {obj_type}")
-
-        # Ensure rendered_mappings includes parent_id
-        rendered_mappings = {'parent_id': parent_id}
+        with timer.span("Per Object", obj_type=obj_type):
+            rendered_mappings = self.render_item(obj_type, obj_config, item, parent_id, prefetched)
+            if rendered_mappings is None:
+                return
+            mapped_data = self.transform_item(obj_type, obj_config, destination_api, item, rendered_mappings, parent_id)
+            if mapped_data is None:
+                return
+            self.write_item(obj_type, obj_config, destination_api, item, mapped_data, parent_id)
+
+    def render_item(self, obj_type, obj_config, item, parent_id=None, prefetched=None):
+        """
+        Render the field templates of one item (the CPU-bound step).
+        Returns {dest_field: rendered value}, or None if the item is excluded.
+        """
+        # Each attribute path of this item is resolved once, across all field templates
+        resolution_cache = ResolutionCache()
+        for key, paths in (prefetched or {}).items():
+            for path, value in paths.items():
+                resolution_cache.seed(item[key], path, value)
+
+        # parent_id is only part of the render context; it is not a destination field
+        # (it used to lead the payload, so root objects with no parent never got written)
+        rendered_mappings = {}
         mappings = obj_config.get('mapping', {})
         if not mappings:
-            print(f"No mappings defined for {obj_type}. Skipping.")
-            return
-        # Separate nested_mappings from regular mappings
-        nested_mappings = mappings.pop('nested_mappings', None)
+            logger.warning("No mappings defined for %s. Skipping.", obj_type)
+            return None
+
+        # Base context is the item itself plus parent_id, built once per item rather than
+        # copied per field; ChainMap layers parent_id over the item without copying it
+        context = ChainMap({'parent_id': parent_id}, item)
 
         for dest_field, field_info in mappings.items():
+            # nested_mappings are processed after the object itself is written
+            if dest_field == 'nested_mappings':
+                continue
             if field_info is None:
-                print(f"Skipping field {dest_field} because field_info is None.")
+                logger.debug("Skipping field %s because field_info is None.", dest_field)
                 continue
 
             # Render the source template for the field
             if 'source' in field_info:
                 try:
-                    context = {**item}  # Base context is the item itself
-                    context.update({'parent_id': parent_id}) 
                     rendered_mappings[dest_field] = self._render_template(
-                        field_info['source'], context
+                        field_info['source'], context, resolution_cache
                     )
                 except Exception as e:
-                    print(f"Error rendering field {dest_field}: {e}")
+                    logger.error("Error rendering field %s: %s", dest_field, e)
                     rendered_mappings[dest_field] = None
 
-        # Process the mapped data
+        # Apply exclusion logic before any transform can look up or create related objects
+        for dest_field, rendered_source_value in rendered_mappings.items():
+            exclude_patterns = mappings[dest_field].get('exclude', [])
+            if not isinstance(exclude_patterns, list):
+                exclude_patterns = [str(exclude_patterns)]
+            if any(re.match(pattern, str(rendered_source_value)) for pattern in exclude_patterns):
+                logger.debug("Excluding object %s based on exclusion criteria.", rendered_mappings.get('name', '<unknown>'))
+                return None
+
+        return rendered_mappings
+
+    def transform_item(self, obj_type, obj_config, destination_api, item, rendered_mappings, parent_id=None):
+        """
+        Apply the field actions (regex_replace, listify, lookup_object, ...) in field order.
+        Returns the mapped payload, or None if a lookup failed and the item was dead-lettered.
+        """
+        mappings = obj_config.get('mapping', {})
         mapped_data = {}
-        exclude_object = False
 
         for dest_field, rendered_source_value in rendered_mappings.items():
             field_info = mappings.get(dest_field, {})
-            if not field_info and 'parent_id' not in dest_field:
-                print(f"Skipping field {dest_field} because its mapping is missing.")
-                continue
-
-            # Apply exclusion logic
-            exclude_patterns = field_info.get('exclude', [])
-            if isinstance(exclude_patterns, list):
-                for pattern in exclude_patterns:
-                    if bool(re.match(pattern, str(rendered_source_value))):
-                        exclude_object = True
-                        break
-            elif bool(re.match(str(exclude_patterns), str(rendered_source_value))):
-                exclude_object = True
-
-            # Apply transformations
-            if 'action' in field_info and not exclude_object:
+            if 'action' in field_info:
                 action = field_info.get('action')
-                timer.start_timer("Apply Transforms")
-                rendered_source_value = self.apply_transform_function(
-                    rendered_source_value, action, obj_config, destination_api, dest_field, mapped_data, item
-                )
-                timer.stop_timer("Apply Transforms")
+                try:
+                    with timer.span("Apply Transforms"):
+                        rendered_source_value = self.apply_transform_function(
+                            rendered_source_value, action, obj_config, destination_api, dest_field, mapped_data, item
+                        )
+                except Exception as e:
+                    self._dead_letter(obj_type, obj_config, 'transform', item, mapped_data, e, destination_api, parent_id)
+                    return None
                 if 'exclude_field' in str(rendered_source_value):
                     continue
 
             mapped_data[dest_field] = rendered_source_value
 
-        # Skip excluded objects
-        if exclude_object:
-            if self.debug:
-                print(f"Excluding object {rendered_mappings.get('name', '<unknown>')} based on exclusion criteria.")
-            return
+        return mapped_data
 
-        # Create or update the object in the destination
-        for destination_client in destination_api.clients:
-            create_function = obj_config.get('create_function')
-            update_function = obj_config.get('update_function')
-            find_function = obj_config.get('find_function')
-            timer.start_timer(f"Create or Update {obj_type}")
-            self.create_or_update(destination_client, find_function, create_function, update_function, mapped_data)
-            timer.stop_timer(f"Create or Update {obj_type}")
-
-        # Process nested mappings explicitly
+    def write_item(self, obj_type, obj_config, destination_api, item, mapped_data, parent_id=None):
+        """
+        Create or update the object in every destination client, then process its nested mappings.
+        """
+        create_function = obj_config.get('create_function')
+        update_function = obj_config.get('update_function')
+        find_function = obj_config.get('find_function')
+        if obj_config.get('prune'):
+            self._record_seen(obj_type, mapped_data)
+        object_id = None
+        for client_index, destination_client in enumerate(destination_api.clients):
+            try:
+                with timer.span("Create or Update", obj_type=obj_type):
+                    written_id = self.create_or_update(destination_client, find_function, create_function, update_function,
+                                                       mapped_data, (obj_type, destination_api.name, client_index))
+            except Exception as e:
+                # Nested objects of a failed parent are skipped; replaying the parent redoes them
+                self._dead_letter(obj_type, obj_config, 'write', item, mapped_data, e, destination_api, parent_id)
+                return
+            # Nested objects reference the parent in the first destination client
+            if client_index == 0:
+                object_id = written_id
+
+        nested_mappings = obj_config.get('mapping', {}).get('nested_mappings')
         if nested_mappings:
-            for nested_obj_type, nested_obj_config in nested_mappings.items():
-                print(f"Found Nested {nested_obj_type} mapping under {obj_type} Mapping.")
+            self._process_nested_mappings(obj_type, nested_mappings, item, object_id, destination_api)
 
-                # Use the parent API if destination_api is not explicitly defined'
-                self._process_nested_mappings(nested_obj_type, nested_obj_config, item, parent_id, destination_api)
+    def _dead_letter(self, obj_type, obj_config, stage, item, mapped_data, error, destination_api, parent_id):
+        """
+        Record an object that failed after all retries and carry on with the next one.
+        """
+        with self._failures_lock:
+            self.failures[obj_type] += 1
+        if self.dead_letters is None:
+            raise error
+        self.dead_letters.add(
+            obj_type, stage, item, self._mapping_required_keys(obj_config, include_nested=True), mapped_data, error,
+            destination_api=getattr(destination_api, 'name', destination_api), parent_id=parent_id,
+        )
+
+    def _find_mapping_config(self, obj_type, mappings=None):
+        """
+        The object_mapping (or nested mapping) configuration named obj_type.
+        """
+        mappings = self.config['object_mappings'] if mappings is None else mappings
+        if obj_type in mappings:
+            return mappings[obj_type]
+        for obj_config in mappings.values():
+            nested_mappings = (obj_config.get('mapping') or {}).get('nested_mappings')
+            if nested_mappings:
+                found = self._find_mapping_config(obj_type, nested_mappings)
+                if found is not None:
+                    return found
+        return None
+
+    def replay_dead_letters(self, path):
+        """
+        Re-process the items of a dead-letter file through their (possibly fixed) mappings.
+        Items failing again are written to the current dead-letter file.
+        """
+        entries = DeadLetterQueue.read(path)
+        if self.dead_letters and os.path.abspath(path) == os.path.abspath(self.dead_letters.path):
+            os.replace(path, path + '.replayed')
+        logger.info("Replaying %s failed objects from %s", len(entries), path)
+
+        failed = 0
+        for entry in entries:
+            obj_type = entry['obj_type']
+            obj_config = self._find_mapping_config(obj_type)
+            if obj_config is None:
+                logger.error("No object_mapping named %s; skipping failed entry", obj_type)
+                self.failures[obj_type] += 1
+                failed += 1
+                continue
+            destination_api = self.sources[entry.get('destination_api') or obj_config['destination_api']]
+            # An entry failed if it, or any of its nested objects, was dead-lettered again
+            failures_before = sum(self.failures.values())
+            self.process_single_mapping(obj_type, obj_config, destination_api, entry['item'], entry.get('parent_id'))
+            if sum(self.failures.values()) > failures_before:
+                failed += 1
+
+        logger.info("Replayed %s objects: %s succeeded, %s failed", len(entries), len(entries) - failed, failed)
+
+    def apply_plan(self, path, batch_size=100):
+        """
+        Execute a change plan written by --plan in bulk batches, without finding or
+        diffing the objects again. Refs are replaced by the ids of the objects created
+        earlier in the plan. Stops at the first failed batch; applied batches are recorded
+        in an AppliedLog, so running it again continues after them.
+        """
+        entries = ChangePlan.read(path)
+        applied_log = AppliedLog(path)
+        previously_applied = applied_log.load()
+        ids = {ref: object_id for ref, object_id in previously_applied.items() if object_id is not None}
+        if previously_applied:
+            logger.info("Resuming plan %s: %s of %s changes were already applied", path, len(previously_applied), len(entries))
+            entries = [entry for entry in entries if entry['ref'] not in previously_applied]
+        logger.info("Applying %s planned changes from %s", len(entries), path)
+        applied = 0
+        for batch in plan_batches(entries, batch_size):
+            first = batch[0]
+            destination_client = self.sources[first['destination_api']].clients[first['client']]
+            function = self.get_nested_function(destination_client, first['function'])
+            try:
+                with timer.span("Apply Plan", obj_type=first['obj_type'], action=first['action']):
+                    if first['action'] == 'delete':
+                        function([entry['id'] for entry in batch])
+                    elif first['action'] == 'update':
+                        function([resolve_refs(entry['payload'], ids) for entry in batch])
+                    else:
+                        payloads = [resolve_refs(entry['payload'], ids) for entry in batch]
+                        new_objects = [function(payloads[0])] if len(payloads) == 1 else list(function(payloads))
+                        for entry, new_object in zip(batch, new_objects):
+                            ids[entry['ref']] = new_object.id
+                            self.created_ids.append(new_object.id)
+            except Exception as e:
+                logger.error("Applying %s %s %s failed after %s of %s changes: %s",
+                             len(batch), first['action'], first['obj_type'], applied, len(entries), e)
+                raise
+            applied_log.record(batch, ids)
+            applied += len(batch)
+            logger.debug("Applied %s %s %s", len(batch), first['action'], first['obj_type'])
+        logger.info("Applied %s planned changes", applied)
+
+    @staticmethod
+    def _object_key(data):
+        """
+        ((field, value), ...) of the key fields create_or_update finds an object by, with
+        values as strings so rendered and destination values compare equal. None if a key
+        field is empty.
+        """
+        key = tuple((field, value) for field, value in list(data.items())[:2])
+        if any(value is None for _, value in key):
+            return None
+        return tuple((field, str(value)) for field, value in key)
+
+    def _record_seen(self, obj_type, mapped_data):
+        key = self._object_key(self.sanitize_data(mapped_data))
+        if key is not None:
+            # set.add is atomic, so pipeline and nested threads can record concurrently
+            self.seen_keys.setdefault(obj_type, set()).add(key)
+
+    def prune_orphans(self, obj_type, obj_config):
+        """
+        Delete the destination objects of obj_type that were not produced by this run.
+
+        The destination is listed once in bulk and compared locally against the keys seen
+        in the source stream; orphans are deleted in bulk batches. With --dry-run they are
+        only reported. Nothing is deleted if more than max_delete_percent of the listed
+        objects would go.
+
+            devices:
+              prune:
+                filter: {tag: nbsync}        # only objects matching this are candidates
+                max_delete_percent: 10
+                batch_size: 100
+                list_function: dcim.devices.filter    # default: find_function with a filter, else .all
+                delete_function: dcim.devices.delete  # default: derived from find_function
+        """
+        prune = obj_config['prune'] if isinstance(obj_config['prune'], dict) else {}
+        endpoint = obj_config['find_function'].rsplit('.', 1)[0]
+        filter_params = prune.get('filter') or {}
+        list_path = prune.get('list_function') or (obj_config['find_function'] if filter_params else f"{endpoint}.all")
+        delete_path = prune.get('delete_function') or f"{endpoint}.delete"
+        max_delete_percent = prune.get('max_delete_percent', 10)
+        batch_size = prune.get('batch_size', 100)
+
+        seen = self.seen_keys.get(obj_type, set())
+        key_fields = {tuple(field for field, _ in key) for key in seen}
+        destination_api = self.sources[obj_config['destination_api']]
+
+        for destination_client in destination_api.clients:
+            list_function = self.get_nested_function(destination_client, list_path)
+            total = 0
+            orphans = []
+            with timer.span("Prune Index", obj_type=obj_type):
+                for existing_object in list_function(**filter_params):
+                    total += 1
+                    current_data = self.sanitize_data(existing_object.serialize())
+                    if not any(tuple((field, str(current_data.get(field))) for field in fields) in seen
+                               for fields in key_fields):
+                        orphans.append((existing_object.id, getattr(existing_object, 'name', None)))
+
+            if not orphans:
+                logger.info("Prune %s: none of %s objects are orphaned", obj_type, total)
+                continue
+            percent = 100.0 * len(orphans) / total
+            if percent > max_delete_percent:
+                logger.error("Refusing to prune %s: %s of %s objects (%.1f%%) would be deleted, above max_delete_percent %s",
+                             obj_type, len(orphans), total, percent, max_delete_percent)
+                continue
+
+            client_index = destination_api.clients.index(destination_client)
+            for object_id, name in orphans:
+                if self.plan is not None:
+                    self.plan.add(obj_type, 'delete', destination_api.name, client_index, delete_path,
+                                  object_id=object_id, name=name)
+                else:
+                    logger.info("%s %s %s #%s", "[DRY RUN] Would delete" if self.dry_run else "Deleting", obj_type, name, object_id)
+            if self.dry_run:
+                logger.info("[DRY RUN] Prune %s: would delete %s of %s objects (%.1f%%)", obj_type, len(orphans), total, percent)
+                continue
+
+            delete_function = self.get_nested_function(destination_client, delete_path)
+            for start in range(0, len(orphans), batch_size):
+                with timer.span("Delete objects", obj_type=obj_type):
+                    delete_function([object_id for object_id, _ in orphans[start:start + batch_size]])
+            logger.info("Pruned %s: deleted %s of %s objects", obj_type, len(orphans), total)
 
+    def _process_nested_mappings(self, obj_type, nested_mappings, item, parent_id, parent_destination_api):
+        """
+        Process the nested mappings of a written object, with parent_id set to its id.
+        Sibling nested mapping types run in parallel.
+        """
+        present = []
+        for nested_obj_type, nested_obj_config in nested_mappings.items():
+            nested_data = item.get(nested_obj_type, [])
+            if nested_data:
+                logger.debug("Found Nested %s mapping under %s Mapping.", nested_obj_type, obj_type)
+                present.append((nested_obj_type, nested_obj_config, list(nested_data)))
+
+        if self.nested_workers <= 1 or len(present) <= 1:
+            for nested_obj_type, nested_obj_config, nested_data in present:
+                self._process_nested_type(nested_obj_type, nested_obj_config, nested_data, parent_id, parent_destination_api)
+            return
+        self._run_concurrently(
+            lambda nested: self._process_nested_type(*nested, parent_id, parent_destination_api), present, len(present)
+        )
 
-        timer.stop_timer(f"Per Object Timing {obj_type}")
+    def _process_nested_type(self, obj_type, obj_config, nested_data, parent_id, parent_destination_api):
+        """
+        Prepare (render, transform, find) the nested items of one parent concurrently, then
+        write them in batches: one bulk create and one bulk update call per batch.
+        """
+        # Use the parent API if destination_api is not explicitly defined
+        destination_name = obj_config.get('destination_api')
+        destination_api = self.sources[destination_name] if destination_name else parent_destination_api
 
+        if self.nested_workers <= 1 or len(nested_data) == 1:
+            for nested_item in nested_data:
+                self.process_single_mapping(obj_type, obj_config, destination_api, nested_item, parent_id)
+            return
 
-    def _process_nested_mappings(self, nested_obj_type, nested_obj_config, item, parent_id, parent_destination_api):
-        """Process nested mappings recursively."""
-        nested_data = item.get(nested_obj_type, [])
-        destination_api = nested_obj_config.get('destination_api', parent_destination_api)
+        def prepare(nested_item):
+            with timer.span("Per Object", obj_type=obj_type):
+                rendered_mappings = self.render_item(obj_type, obj_config, nested_item, parent_id)
+                if rendered_mappings is None:
+                    return None
+                mapped_data = self.transform_item(obj_type, obj_config, destination_api, nested_item, rendered_mappings, parent_id)
+                if mapped_data is None:
+                    return None
+                plans = self._plan_item(obj_type, obj_config, destination_api, nested_item, mapped_data, parent_id)
+                return None if plans is None else (nested_item, mapped_data, plans)
+
+        prepared = [entry for entry in self._run_concurrently(prepare, nested_data, self.nested_workers) if entry is not None]
+
+        # Items sharing a key with an earlier one were planned before it was written;
+        # they are written one by one afterwards, so they update instead of duplicating
+        batch, deferred, seen = [], [], set()
+        for entry in prepared:
+            key = repr(list(entry[1].items())[:2])
+            if key in seen:
+                deferred.append(entry)
+                continue
+            seen.add(key)
+            batch.append(entry)
+            if len(batch) >= self.nested_batch_size:
+                self._write_batch(obj_type, obj_config, destination_api, batch, parent_id)
+                batch = []
+        if batch:
+            self._write_batch(obj_type, obj_config, destination_api, batch, parent_id)
+        for nested_item, mapped_data, _ in deferred:
+            self.write_item(obj_type, obj_config, destination_api, nested_item, mapped_data, parent_id)
+
+    def _run_concurrently(self, func, values, workers):
+        """
+        [func(value) for value in values] on up to `workers` threads, re-raising the first error.
+        """
+        with ThreadPoolExecutor(max_workers=min(workers, len(values)), thread_name_prefix='nbsync-nested') as executor:
+            # A context copy per call keeps timer spans nested under the caller's span
+            futures = [executor.submit(contextvars.copy_context().run, func, value) for value in values]
+            return [future.result() for future in futures]
+
+    def _plan_item(self, obj_type, obj_config, destination_api, item, mapped_data, parent_id):
+        """
+        Write plans for one item in every destination client, or None if it was dead-lettered.
+        """
+        try:
+            with timer.span("Find Object", obj_type=obj_type):
+                return [self.plan_write(client, obj_config.get('find_function'), mapped_data)
+                        for client in destination_api.clients]
+        except Exception as e:
+            self._dead_letter(obj_type, obj_config, 'write', item, mapped_data, e, destination_api, parent_id)
+            return None
 
-        for nested_item in nested_data:
-            self.process_single_mapping(nested_obj_type, nested_obj_config, destination_api, nested_item, parent_id)
+    def _write_batch(self, obj_type, obj_config, destination_api, batch, parent_id):
+        """
+        Apply the plans of a batch of prepared (item, mapped_data, plans) entries, then
+        process the nested mappings of each written item under its new id.
+        """
+        create_function = obj_config.get('create_function')
+        update_function = obj_config.get('update_function')
+        object_ids = [None] * len(batch)
+        failed = set()
+        for client_index, destination_client in enumerate(destination_api.clients):
+            positions = [position for position, entry in enumerate(batch)
+                         if position not in failed and entry[2][client_index] is not None]
+            plans = [batch[position][2][client_index] for position in positions]
+            if not plans:
+                continue
+            try:
+                target = (obj_type, destination_api.name, client_index)
+                with timer.span("Create or Update", obj_type=obj_type):
+                    written_ids = self.apply_writes(destination_client, create_function, update_function, plans, target)
+            except Exception as e:
+                if len(plans) > 1:
+                    logger.warning("Bulk write of %s %s failed (%s); writing them one by one", len(plans), obj_type, e)
+                written_ids = []
+                for position, plan in zip(positions, plans):
+                    try:
+                        with timer.span("Create or Update", obj_type=obj_type):
+                            written_ids.append(self.apply_writes(destination_client, create_function, update_function,
+                                                                 [plan], target)[0])
+                    except Exception as e:
+                        nested_item, mapped_data, _ = batch[position]
+                        self._dead_letter(obj_type, obj_config, 'write', nested_item, mapped_data, e, destination_api, parent_id)
+                        failed.add(position)
+                        written_ids.append(None)
+            if client_index == 0:
+                for position, written_id in zip(positions, written_ids):
+                    object_ids[position] = written_id
+
+        nested_mappings = obj_config.get('mapping', {}).get('nested_mappings')
+        if nested_mappings:
+            for position, (nested_item, _, _) in enumerate(batch):
+                if position not in failed:
+                    self._process_nested_mappings(obj_type, nested_mappings, nested_item, object_ids[position], destination_api)
 
   
     def apply_transform_function(self, value, actions, obj_config, destination_api, field_name, mapped_data, item):
@@ -327,7 +1241,7 @@ class DataTransferTool:
                 find_function_path = lookup_config.get('find_function')
                 create_function_path = lookup_config.get('create_function')
                 append_fields = lookup_config.get('append', {})
-                print(f"Append: {append_fields}")
+                logger.debug("Append: %s", append_fields)
                 additional_data = self._render_nested_structure(append_fields, mapped_data)
                 lookup_result = self.lookup_object(
                     value, lookup_field, find_function_path, create_function_path, destination_api,
@@ -336,7 +1250,7 @@ class DataTransferTool:
                 if lookup_result is not None:
                     value = lookup_result.id
                 else:
-                    print(f"Warning: Lookup failed for {lookup_field} with value {value}")
+                    logger.warning("Lookup failed for %s with value %s", lookup_field, value)
             elif 'exclude' in action:
                 # Handle `exclude`
                 exclude_value = action['exclude']
@@ -347,7 +1261,15 @@ class DataTransferTool:
 
 
     def get_nested_function(self, api_client, function_path):
-        """Recursively get a function from the API client."""
+        """
+        Recursively get a function from the API client.
+        The function is wrapped for per-endpoint call accounting and cached per client.
+        """
+        cache_key = (id(api_client), function_path)
+        cached = self._function_cache.get(cache_key)
+        if cached is not None and cached[0] is api_client:
+            return cached[1]
+
         parts = function_path.split('.')
         func = api_client  # Start with the root client (e.g., pynetbox.NetBox())
         for part in parts:
@@ -357,8 +1279,35 @@ class DataTransferTool:
                 raise AttributeError(f"Attribute '{part}' not found in API client at path '{function_path}'")
         if not callable(func):
             raise TypeError(f"Final attribute in path '{function_path}' is not callable.")
+
+        base_url = getattr(api_client, 'base_url', None)
+        config = self._client_config(api_client)
+        func = self.api_stats.instrument(func, function_path, base_url)
+        # The limiter wraps the instrumented call, so time spent waiting for a slot is not
+        # counted as API latency; every retry goes through the limiter again
+        func = self._rate_limiter(api_client, base_url, config).wrap(func)
+        func = RetryPolicy.from_config(config.get('retry')).wrap(func, function_path, idempotent='create' not in parts[-1])
+        self._function_cache[cache_key] = (api_client, func)
         return func
 
+    def _client_config(self, api_client):
+        """
+        The api_definitions entry of the source that owns api_client.
+        """
+        return next((source.config for source in self.sources.values()
+                     if any(client is api_client for client in source.clients)), {})
+
+    def _rate_limiter(self, api_client, base_url, config):
+        """
+        The AdaptiveLimiter of api_client's destination, configured by the `rate_limit`
+        section of its api_definitions entry.
+        """
+        key = base_url or id(api_client)
+        limiter = self.rate_limiters.get(key)
+        if limiter is None:
+            limiter = self.rate_limiters[key] = AdaptiveLimiter.from_config(base_url or 'destination', config.get('rate_limit'))
+        return limiter
+
     
     
     def sanitize_data(self, data):
@@ -385,50 +1334,128 @@ class DataTransferTool:
         if cache_key in self.lookup_cache:
             return self.lookup_cache[cache_key]
 
+        if self.shared_lookups is None:
+            # One find-or-create per key, even when pipeline threads miss at the same time
+            with self._lookup_lock(cache_key):
+                if cache_key in self.lookup_cache:
+                    return self.lookup_cache[cache_key]
+                return self._find_or_create_lookup(
+                    cache_key, value, lookup_type, find_function_path, create_function_path, destination_api, additional_fields
+                )
+
+        # Worker process or host of a sharded run: finds run in parallel and only the create
+        # is serialised, per key. One caller claims it and the others wait for its id
+        with self._lookup_lock(cache_key):
+            if cache_key in self.lookup_cache:
+                return self.lookup_cache[cache_key]
+            store = self.shared_lookups
+            shared = store.get(cache_key)
+            while shared is None:
+                token = None
+                found = self._find_lookup(cache_key, value, lookup_type, find_function_path, destination_api)
+                if found is None:
+                    token = store.claim(cache_key)
+                    if token is None:
+                        shared = store.wait(cache_key)
+                        if shared is not None or not store.claimed(cache_key):
+                            # Created by the claimant, or its create failed and the key is free again
+                            continue
+                    try:
+                        found = self._create_lookup(
+                            cache_key, value, lookup_type, create_function_path, destination_api, additional_fields
+                        )
+                    except Exception:
+                        if token is not None:
+                            store.release(cache_key, token)
+                        raise
+                if getattr(found, 'id', None) is not None:
+                    store.set(cache_key, (found.id, getattr(found, 'name', None)))
+                elif token is not None:
+                    store.release(cache_key, token)
+                return found
+            found = self.lookup_cache[cache_key] = LookupRef(*shared)
+            return found
+
+    def _lookup_lock(self, cache_key):
+        with self._lookup_locks_guard:
+            lock = self._lookup_locks.get(cache_key)
+            if lock is None:
+                lock = self._lookup_locks[cache_key] = threading.Lock()
+            return lock
+
+    def _find_or_create_lookup(self, cache_key, value, lookup_type, find_function_path, create_function_path,
+                               destination_api, additional_fields):
+        found = self._find_lookup(cache_key, value, lookup_type, find_function_path, destination_api)
+        if found is not None:
+            return found
+        return self._create_lookup(cache_key, value, lookup_type, create_function_path, destination_api, additional_fields)
+
+    def _find_lookup(self, cache_key, value, lookup_type, find_function_path, destination_api):
+        """
+        The existing destination object for a lookup (also cached), or None.
+        """
         api_client = destination_api.api
         find_function = self.get_nested_function(api_client, find_function_path)
-        create_function = self.get_nested_function(api_client, create_function_path)
         # Validate lookup_type and value
-        print("lookup_type={lookup_type}, value={value}")
+        logger.debug("lookup_type=%s, value=%s", lookup_type, value)
         if not lookup_type or value is None:
             raise ValueError(f"Invalid lookup_type or value: lookup_type={lookup_type}, value={value}")
 
         filter_params = {lookup_type: value}        
         # Try finding the object
         try:
-            timer.start_timer(f"Find Object {lookup_type}")
-            found_object = find_function(**filter_params)
-            timer.stop_timer(f"Find Object {lookup_type}")
+            with timer.span("Find Object", lookup_type=lookup_type):
+                found_object = find_function(**filter_params)
 
             if found_object:
                 first_object = list(found_object)[0]
                 self.lookup_cache[cache_key] = first_object
-                print(f"looked up {filter_params} and found {first_object.name}")
+                logger.debug("looked up %s and found %s", filter_params, first_object.name)
                 return first_object
 
         except Exception as e:
-            print(f"Error calling find_function: {str(e)}")
+            # Creating after a failed find could duplicate the object; fail the item instead
+            logger.error("Error calling find_function: %s", e)
+            raise
+        return None
 
-        # If not found, prepare data for creation
+    def _create_lookup(self, cache_key, value, lookup_type, create_function_path, destination_api, additional_fields):
+        api_client = destination_api.api
+        create_function = self.get_nested_function(api_client, create_function_path)
+        # Not found, prepare data for creation
         try:
             create_data = {lookup_type: value}
             create_data.update(additional_fields)  # Include appended fields
             if 'slug' not in create_data:
                 create_data['slug'] = re.sub(r'\W+', '-', value.lower())
 
-            if self.dry_run:
-                print(f"[DRY RUN] Would create {lookup_type} object with data: {create_data}")
+            if self.plan is not None:
+                # Later payloads refer to the planned object (possibly planned by its own mapping) by its ref
+                clients = destination_api.clients
+                client_index = clients.index(api_client) if api_client in clients else 0
+                with self._plan_lock:
+                    planned = self._planned_creates.get(
+                        (destination_api.name, client_index, create_function_path, ((lookup_type, str(value)),))
+                    )
+                if planned is not None:
+                    ref = planned[0]
+                else:
+                    ref = self._plan_create(create_function_path.rsplit('.', 1)[0], destination_api.name, client_index,
+                                            create_function_path, create_data, value)
+                planned = self.lookup_cache[cache_key] = LookupRef(ref, value)
+                return planned
+            elif self.dry_run:
+                logger.info("[DRY RUN] Would create %s object with data: %s", lookup_type, create_data)
             else:
-                print(f"Creating {create_function_path} object with data: {create_data}")
-                timer.start_timer(f"Create Object {lookup_type}")
-                created_object = create_function(create_data)
-                timer.stop_timer(f"Create Object {lookup_type}")
+                logger.info("Creating %s object with data: %s", create_function_path, create_data)
+                with timer.span("Create Object", lookup_type=lookup_type):
+                    created_object = create_function(create_data)
                 self.lookup_cache[cache_key] = created_object
                 return created_object if hasattr(created_object, 'id') else None
 
         except Exception as e:
-            print(f"Error calling create_function: {str(e)}")
-            return None
+            logger.error("Error calling create_function: %s", e)
+            raise
 
 
     def normalize_types(self, data):
@@ -449,8 +1476,20 @@ class DataTransferTool:
         else:
             return data
         
-    def create_or_update(self, api_client, find_function_path, create_function_path, update_function_path, mapped_data):
+    def create_or_update(self, api_client, find_function_path, create_function_path, update_function_path, mapped_data,
+                         target=None):
         """Create or update objects in the destination API."""
+        plan = self.plan_write(api_client, find_function_path, mapped_data)
+        if plan is None:
+            return None
+        return self.apply_writes(api_client, create_function_path, update_function_path, [plan], target)[0]
+
+    def plan_write(self, api_client, find_function_path, mapped_data):
+        """
+        Find the destination object of mapped_data and decide what to write:
+        {'action': 'create' | 'update' | 'unchanged', 'id', 'name', 'payload'},
+        or None when a key field is empty.
+        """
         # Find function
         find_function = self.get_nested_function(api_client, find_function_path)
         # Automatically extract the first two fields from mapped_data as key fields
@@ -465,72 +1504,265 @@ class DataTransferTool:
             if isinstance(value, (int)):
                 key_field = f"{key_field}_id"
             filter_params[key_field] = value
-        
+
+        payload = self.sanitize_data(mapped_data)
+        # A key referring to an object the plan has yet to create cannot match anything
+        if any(is_ref(value) for value in filter_params.values()):
+            return {'action': 'create', 'id': None, 'name': mapped_data.get('name'), 'payload': payload}
+
         # Attempt to find the object
         try:
-            found_object = find_function(**filter_params)
+            if self.plan is not None:
+                found_object = self._find_indexed(api_client, find_function_path, key_fields, mapped_data)
+            else:
+                found_object = find_function(**filter_params)
         except Exception as e:
-            print(f"Error calling find_function: {str(e)}")
+            logger.error("Error calling find_function: %s", e)
             raise
 
-        if found_object:
-            existing_object = list(found_object)[0]
-            mapped_data['id'] = existing_object.id
-            current_data = self.sanitize_data(existing_object.serialize())
-            sanitized_mapped_data = self.sanitize_data(mapped_data)
-            filtered_current_data = {key: current_data.get(key) for key in mapped_data}
-            sanitized_mapped_data = self.sanitize_data(sanitized_mapped_data)
-            # Check for changes in object to determine if we should update
-            timer.start_timer(f"DeepDiff")
-            differences = deepdiff.DeepDiff(filtered_current_data, self.normalize_types(sanitized_mapped_data), ignore_order=True, report_repetition=True, ignore_type_in_groups=[(int, str, float)])
-            timer.stop_timer(f"DeepDiff")
-
-            if differences:
-                print(f"Differences found for {existing_object.name}: {differences}")
+        if not found_object:
+            return {'action': 'create', 'id': None, 'name': mapped_data.get('name'), 'payload': payload}
+
+        existing_object = list(found_object)[0]
+        name = getattr(existing_object, 'name', existing_object.id)
+        # The payload is per destination client; mapped_data is shared by all of them
+        payload['id'] = existing_object.id
+        current_data = self.sanitize_data(existing_object.serialize())
+        filtered_current_data = {key: current_data.get(key) for key in payload}
+        # Check for changes in object to determine if we should update
+        import deepdiff  # deferred: only needed once an existing object is found
+        with timer.span("DeepDiff"):
+            differences = deepdiff.DeepDiff(filtered_current_data, self.normalize_types(payload), ignore_order=True, report_repetition=True, ignore_type_in_groups=[(int, str, float)])
+
+        if not differences:
+            logger.debug("No changes detected for object %s, skipping update.", name)
+            return {'action': 'unchanged', 'id': existing_object.id, 'name': name, 'payload': payload}
+
+        # DeepDiff output is only formatted when debug logging is on
+        logger.debug("Differences found for %s: %s", name, differences)
+        changes = {}
+        for report in differences.values():
+            for path in report:
+                field = re.match(r"root\['([^']+)'\]", path)
+                if field and field.group(1) in payload:
+                    changes[field.group(1)] = {'old': filtered_current_data.get(field.group(1)), 'new': payload[field.group(1)]}
+        return {'action': 'update', 'id': existing_object.id, 'name': name, 'payload': payload, 'changes': changes}
+
+    def _find_indexed(self, api_client, find_function_path, key_fields, mapped_data):
+        """
+        With --plan, find an object in an index of its endpoint listed once in bulk,
+        instead of one find call per item. Objects are matched on the key fields by
+        their string values, like prune_orphans does.
+        """
+        endpoint = find_function_path.rsplit('.', 1)[0]
+        index_key = (id(api_client), endpoint, tuple(key_fields))
+        with self._destination_index_lock:
+            index = self._destination_index.get(index_key)
+            if index is None:
+                index = {}
+                list_function = self.get_nested_function(api_client, f"{endpoint}.all")
+                with timer.span("Plan Index", endpoint=endpoint):
+                    for existing_object in list_function():
+                        current_data = self.sanitize_data(existing_object.serialize())
+                        index.setdefault(tuple(str(current_data.get(field)) for field in key_fields), existing_object)
+                logger.debug("Indexed %s existing objects of %s", len(index), endpoint)
+                self._destination_index[index_key] = index
+        existing_object = index.get(tuple(str(mapped_data[field]) for field in key_fields))
+        return [existing_object] if existing_object is not None else []
+
+    def _plan_create(self, obj_type, destination_name, client_index, create_function_path, payload, name,
+                     update_function_path=None):
+        """
+        Add a create to the plan and return its ref. An object with the same key that is
+        already planned is reused, with an update if this payload differs.
+        """
+        endpoint = (destination_name, client_index, create_function_path)
+        with self._plan_lock:
+            planned = self._planned_creates.get(endpoint + (self._object_key(payload),))
+            if planned is not None:
+                ref, planned_payload = planned
+                changes = {field: {'old': planned_payload.get(field), 'new': value}
+                           for field, value in payload.items() if planned_payload.get(field) != value}
+                if changes and update_function_path:
+                    self.plan.add(obj_type, 'update', destination_name, client_index, update_function_path,
+                                  dict(payload, id=ref), ref, name, changes)
+                return ref
+
+            ref = self.plan.add(obj_type, 'create', destination_name, client_index, create_function_path, payload, name=name)
+            self._planned_creates[endpoint + (self._object_key(payload),)] = (ref, payload)
+            for field, value in payload.items():
+                if isinstance(value, (str, int, float)):
+                    self._planned_creates.setdefault(endpoint + (((field, str(value)),),), (ref, payload))
+            return ref
+
+    def apply_writes(self, api_client, create_function_path, update_function_path, plans, target=None):
+        """
+        Execute write plans with one update call and one create call for all of them.
+        Returns the object id of every plan (None for creates in dry-run mode, or the
+        plan ref with --plan). target is (obj_type, destination_api name, client index).
+        """
+        updates = [plan for plan in plans if plan['action'] == 'update']
+        creates = [plan for plan in plans if plan['action'] == 'create']
+
+        if self.plan is not None and target is not None:
+            obj_type, destination_name, client_index = target
+            for plan in updates:
+                self.plan.add(obj_type, 'update', destination_name, client_index, update_function_path, plan['payload'],
+                              plan['id'], plan['name'], plan.get('changes'))
+            for plan in creates:
+                plan['id'] = self._plan_create(obj_type, destination_name, client_index, create_function_path,
+                                               plan['payload'], plan['name'], update_function_path)
+            return [plan['id'] for plan in plans]
+
+        if updates:
+            for plan in updates:
                 if self.dry_run:
-                    print(f"[DRY RUN] Would update object {existing_object.id} with data")
-                else: 
-                    print(f"Updating object {existing_object.name} {sanitized_mapped_data}:")
-                    update_function = self.get_nested_function(api_client, update_function_path)
-                    timer.start_timer(f"Update object")
-                    update_function([sanitized_mapped_data])
-                    timer.stop_timer(f"Update object")
-                    print(f"Updated object {existing_object.name}:")
-
-
-            else:
-                print(f"No changes detected for object {existing_object.name}, skipping update.")
-            return existing_object.id
-        
-        else:
-            if self.dry_run:
-                print(f"[DRY RUN] Would create new object {mapped_data['name']}")
-            else:
-                print(f"Creating new object {mapped_data['name']}: {mapped_data}")
+                    logger.info("[DRY RUN] Would update object %s with data", plan['id'])
+                else:
+                    logger.info("Updating object %s", plan['name'])
+                    logger.debug("Update payload for %s: %s", plan['name'], plan['payload'])
+            if not self.dry_run:
+                update_function = self.get_nested_function(api_client, update_function_path)
+                with timer.span("Update object"):
+                    update_function([plan['payload'] for plan in updates])
+
+        if creates:
+            for plan in creates:
+                if self.dry_run:
+                    logger.info("[DRY RUN] Would create new object %s", plan['name'])
+                else:
+                    logger.info("Creating new object %s", plan['name'])
+                    logger.debug("Create payload for %s: %s", plan['name'], plan['payload'])
+            if not self.dry_run:
                 create_function = self.get_nested_function(api_client, create_function_path)
-                timer.start_timer(f"Create object")
-                new_object = create_function(self.sanitize_data(mapped_data))
-                timer.stop_timer(f"Create object")
-                print(f"Created New Object {mapped_data['name']} #{new_object.id}")
-                return new_object.id
+                with timer.span("Create object"):
+                    if len(creates) == 1:
+                        new_objects = [create_function(creates[0]['payload'])]
+                    else:
+                        # pynetbox sends a list as one bulk create and returns the objects in order
+                        new_objects = list(create_function([plan['payload'] for plan in creates]))
+                for plan, new_object in zip(creates, new_objects):
+                    plan['id'] = new_object.id
+                    logger.debug("Created New Object %s #%s", plan['name'], new_object.id)
+                    self.created_ids.append(new_object.id)
+
+        return [plan['id'] for plan in plans]
 
 def main():
     parser = argparse.ArgumentParser(description='Data Transfer Tool')
     parser.add_argument('-f', '--file', required=True, help='YAML file to load configurations')
     parser.add_argument('--dry-run', action='store_true', help='Run in dry-run mode without making any changes')
     parser.add_argument('-d','--debug', action='store_true', help='enable debug')
+    parser.add_argument('--watermark-file', help='File used to persist incremental sync watermarks')
+    parser.add_argument('--full-sync', action='store_true', help='Ignore stored watermarks and fetch everything')
+    parser.add_argument('--timings-json', help='Write timer statistics to this JSON file')
+    parser.add_argument('--timings-prom', help='Write timer statistics to this file in Prometheus text format')
+    parser.add_argument('--api-stats', help='Write per-endpoint API call statistics to this JSON file')
+    parser.add_argument('--log-level', default=None, help='Log level (DEBUG, INFO, WARNING, ERROR); -d implies DEBUG')
+    parser.add_argument('--log-json', action='store_true', help='Emit log records as JSON lines')
+    parser.add_argument('--profile', nargs='?', const='nbsync.prof', help='Run under cProfile and write the profile to this file (default: nbsync.prof)')
+    parser.add_argument('--profile-top', type=int, default=30, help='Number of functions to print from the profile')
+    parser.add_argument('--dump-parquet', metavar='DIR', help='Dump the fetched source data of every object_mapping to Parquet files in DIR')
+    parser.add_argument('--cache-sources', action='store_true', help='Cache fetch_data results as local snapshots and reuse them while fresh')
+    parser.add_argument('--replay', action='store_true', help='Only read source data from existing snapshots, never fetch')
+    parser.add_argument('--cache-dir', default='.nbsync_cache', help='Directory for source snapshots (default: .nbsync_cache)')
+    parser.add_argument('--cache-ttl', type=float, default=3600, help='Seconds a source snapshot stays fresh (0 = forever)')
+    parser.add_argument('--checkpoint-file', help='File used to record run progress (default: .nbsync_checkpoint-<config path hash>.json)')
+    parser.add_argument('--checkpoint-every', type=int, default=500, help='Record progress after every N processed items (0 disables checkpoints)')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted run from its last checkpoint')
+    parser.add_argument('--dead-letter-file', help='JSON lines file for objects that fail after all retries (default: nbsync_failed.jsonl)')
+    parser.add_argument('--replay-failed', metavar='FILE', help='Only re-process the failed objects recorded in this dead-letter file')
+    parser.add_argument('--processes', type=int, default=1, help='Shard the items of each object_mapping over N worker processes')
+    parser.add_argument('--shard', help="Process one shard of a run split across hosts: 'i/N' (0-based) or 'auto/N' to claim a free one")
+    parser.add_argument('--coordinator', default='.nbsync_coordinator.db', help='SQLite database coordinating a sharded run (default: .nbsync_coordinator.db)')
+    parser.add_argument('--run-id', help='Identifier shared by the hosts of one sharded run (default: config hash, shard count and date)')
+    parser.add_argument('--pipeline', action='store_true', help='Overlap fetching, rendering, lookups and writes in stages connected by bounded queues')
+    parser.add_argument('--queue-size', type=int, default=100, help='Items buffered between pipeline stages')
+    parser.add_argument('--render-workers', type=int, default=1, help='Threads rendering templates in pipeline mode')
+    parser.add_argument('--lookup-workers', type=int, default=4, help='Threads applying transforms and lookups in pipeline mode')
+    parser.add_argument('--write-workers', type=int, default=4, help='Threads creating/updating objects in pipeline mode')
+    parser.add_argument('--nested-workers', type=int, default=8, help='Threads preparing the nested items of one parent (1 = serial)')
+    parser.add_argument('--nested-batch-size', type=int, default=50, help='Nested items written per bulk create/update call')
+    parser.add_argument('--plan', metavar='FILE', help='Dry run that writes the creates, updates and deletes it would make to this JSON lines file')
+    parser.add_argument('--apply-plan', metavar='FILE', help='Execute a change plan written by --plan, without diffing again; re-running it continues after the applied changes')
+    parser.add_argument('--apply-batch-size', type=int, default=100, help='Planned changes sent per bulk API call')
+    parser.add_argument('--config-cache', nargs='?', const='.nbsync_cache', metavar='DIR', help='Cache the parsed config and compiled templates in DIR (default: .nbsync_cache)')
+    parser.add_argument('--trace-memory', action='store_true', help='Track memory with tracemalloc, snapshotting after each object_mapping')
     args = parser.parse_args()
     debug=args.debug
-    tool = DataTransferTool(args.file, args.dry_run, args.debug)
-    tool.initialize_sources()
-    tool.process_mappings()
+    setup_logging(args.log_level or ('DEBUG' if debug else 'INFO'), json_output=args.log_json)
 
-if __name__ == "__main__":
-    timer = Timer(True)
-    timer.start_timer(f"Total Runtime")
-    main()
-    timer.stop_timer(f"Total Runtime")
-    timer.show_timers()
+    profiler = None
+    if args.profile or args.trace_memory:
+        profiler = RunProfiler(args.profile, top=args.profile_top, trace_memory=args.trace_memory)
+        profiler.start()
+
+    try:
+        with timer.span("Total Runtime"):
+            tool = DataTransferTool(args.file, args.dry_run or bool(args.plan), args.debug, args.watermark_file, args.full_sync,
+                                    config_cache=args.config_cache)
+            tool.profiler = profiler
+            if args.profile or args.api_stats:
+                tool.api_stats.measure_payloads = True
+            if args.dump_parquet:
+                tool.dump_dir = args.dump_parquet
+            if args.cache_sources or args.replay:
+                tool.snapshots = SnapshotCache(args.cache_dir, ttl=args.cache_ttl, replay=args.replay)
+            if args.checkpoint_every > 0 and not (args.dry_run or args.plan):
+                tool.checkpoints = CheckpointStore(args.checkpoint_file or default_checkpoint_path(args.file),
+                                                   every=args.checkpoint_every, config_file=args.file)
+                if args.resume:
+                    tool.checkpoints.load()
+            if args.dead_letter_file:
+                tool.dead_letters = DeadLetterQueue(args.dead_letter_file)
+            tool.processes = args.processes
+            tool.nested_workers = args.nested_workers
+            tool.nested_batch_size = args.nested_batch_size
+            if args.plan:
+                tool.plan = ChangePlan(args.plan)
+            if args.pipeline or args.plan:
+                tool.pipeline_options = {'queue_size': args.queue_size, 'render_workers': args.render_workers,
+                                         'lookup_workers': args.lookup_workers, 'write_workers': args.write_workers}
+            tool.worker_options = {'log_level': args.log_level or ('DEBUG' if debug else 'INFO'), 'log_json': args.log_json}
+            if args.shard:
+                tool.join_distributed_run(args.shard, args.coordinator, args.run_id)
+            if args.replay_failed:
+                tool.initialize_sources(destinations_only=True)
+                tool.replay_dead_letters(args.replay_failed)
+            elif args.apply_plan:
+                tool.initialize_sources(destinations_only=True)
+                tool.apply_plan(args.apply_plan, args.apply_batch_size)
+            else:
+                tool.initialize_sources()
+                try:
+                    tool.process_mappings()
+                except BaseException:
+                    if tool.coordinator:
+                        tool.finish_distributed_run(failed=True)
+                    raise
+                if tool.coordinator:
+                    tool.finish_distributed_run()
+                if tool.plan is not None:
+                    tool.plan.close()
+    finally:
+        if profiler:
+            profiler.stop()
+            profiler.report()
 
+    timer.show_timers()
+    tool.api_stats.show()
+    if tool.failures:
+        logger.warning("%s objects failed and were written to %s: %s", sum(tool.failures.values()),
+                       tool.dead_letters.path, dict(tool.failures))
+    for limiter in tool.rate_limiters.values():
+        if limiter.throttled or limiter.slowdowns:
+            logger.info("Rate limiting %s", limiter.summary())
+    if args.api_stats:
+        tool.api_stats.export_json(args.api_stats)
+    if args.timings_json:
+        timer.export_json(args.timings_json)
+    if args.timings_prom:
+        timer.export_prometheus(args.timings_prom)
 
-    
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,32 @@
 import ssl
 import importlib
 from sources.base import DataSource
-import requests
-from bravado.client import SwaggerClient
-from bravado.requests_client import RequestsClient
 import datetime
 import time
 import inspect
 import types
-import urllib3
+from utils.log import get_logger
+
+logger = get_logger('api')
 
 class APIDataSource(DataSource):
     def __init__(self, name, config):
-        super().__init__(config)
-        self.name = name
+        super().__init__(name, config)
         self.api = None
-        self.clients = []
         self.session_expiry = {}
+        self._auth_function = None
+        self._disable_tls_warnings()
+
+    @staticmethod
+    def _disable_tls_warnings():
+        """
+        Silence urllib3's warning for the unverified TLS connections made by the HTTP
+        SDKs. urllib3 comes with those SDKs, so without it there is nothing to silence.
+        """
+        try:
+            import urllib3
+        except ImportError:
+            return
         urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
     def is_session_valid(self, base_url):
@@ -35,6 +45,8 @@ class APIDataSource(DataSource):
 
     def _authenticate_swagger(self, base_url):
         """Authenticate using Bravado (Swagger) with various auth methods."""
+        # Imported here so only api-swagger sources pay for bravado
+        from bravado.requests_client import RequestsClient
         http_client = RequestsClient()
         auth_method = self.config['auth_method']
         auth_args = self.config['auth_args']  # Assume auth_args is a dictionary
@@ -71,9 +83,8 @@ class APIDataSource(DataSource):
         print(f"Connected to REST API")
 
     def _authenticate_standard(self, base_url):
-        module = importlib.import_module(self.config['module'])
         auth_method = self.config['auth_method']
-        auth_func = self._get_auth_function(module, self.config['auth_function'])
+        auth_func = self._get_sdk_auth_function()
         auth_args = self._prepare_auth_args(base_url)
         branch = None
         # Add base_url if required
@@ -141,6 +152,16 @@ class APIDataSource(DataSource):
             auth_args['host'] = base_url
         return auth_args
 
+    def _get_sdk_auth_function(self):
+        """
+        Import the configured SDK module and resolve its auth function once per source,
+        on first authentication rather than at startup or for every base_url.
+        """
+        if self._auth_function is None:
+            module = importlib.import_module(self.config['module'])
+            self._auth_function = self._get_auth_function(module, self.config['auth_function'])
+        return self._auth_function
+
     def _get_auth_function(self, module, function_path):
         """Retrieve auth function from a module, allowing for submodules."""
         func_parts = function_path.split(".")
@@ -159,6 +180,7 @@ class APIDataSource(DataSource):
         headers = {'Content-Type': 'application/json'}
 
         print(f"Logging in to {login_url}")
+        import requests
         response = requests.post(login_url, json=login_data, headers=headers, verify=False)
         
         if response.status_code == 200:
@@ -172,10 +194,13 @@ class APIDataSource(DataSource):
         else:
             raise ConnectionError(f"Login failed with status code {response.status_code}")
 
-    def fetch_data(self, obj_config, api_client):
+    def fetch_data(self, obj_config, api_client, since=None, fields=None, **hints):
         """
         Fetch data from the API using either a direct fetch_data_function or a custom Python code block.
         Dynamically load modules specified in the 'imports' section of the YAML and inject into globals.
+        If the custom fetch_data accepts a `since` argument it receives the stored watermark
+        so it can return only changed records; a `fields` argument receives the dotted
+        property paths the mapping templates use, so only those need to be requested.
         """
 
         # Handle imports specified in YAML
@@ -213,14 +238,95 @@ class APIDataSource(DataSource):
             # Call the dynamically defined function
             fetch_func = local_vars['fetch_data']
             if isinstance(fetch_func, types.FunctionType):
-                return fetch_func(api_client)
+                return self._call_fetch_function(fetch_func, api_client, since=since, fields=fields)
             else:
                 raise TypeError("fetch_data is not a valid function")
 
         # If no fetch method is specified, raise an error
         raise ValueError("No valid fetch method (fetch_data_function or fetch_data_code) found")
 
-        
+    def _call_fetch_function(self, fetch_func, api_client, **hints):
+        """
+        Call a custom fetch_data function, passing only the optional hints it declares.
+        Functions written as fetch_data(api_client) keep working unchanged.
+        """
+        parameters = inspect.signature(fetch_func).parameters
+        accepts_kwargs = any(p.kind == inspect.Parameter.VAR_KEYWORD for p in parameters.values())
+        kwargs = {name: value for name, value in hints.items() if accepts_kwargs or name in parameters}
+        return fetch_func(api_client, **kwargs)
+
+    def prefetch_properties(self, api_client, items, required_keys):
+        """
+        Bulk-fetch the property paths the templates use for every pyVmomi managed object
+        found at the top level of the items, with a single PropertyCollector round trip
+        instead of one lazy fetch per attribute.
+
+        Only managed objects under a key of a dict item are prefetched (an item like
+        {'vm': vm} with templates using vm.runtime.powerState). Items that are managed
+        objects themselves cannot be rendered either, since the render context is built
+        from a mapping; they are reported and skipped, and fetch_data should wrap them.
+        """
+        try:
+            from pyVmomi import vim, vmodl
+        except ImportError:
+            return None
+
+        # Group the required sub-paths by top-level item key (e.g. 'vm' -> ['runtime.powerState'])
+        paths_by_key = {}
+        for key in required_keys:
+            if '.' in key:
+                top_key, sub_path = key.split('.', 1)
+                paths_by_key.setdefault(top_key, set()).add(sub_path)
+        if not paths_by_key:
+            return None
+
+        # Collect the managed objects and the paths needed per managed object type
+        object_specs = {}
+        paths_by_type = {}
+        unwrapped = 0
+        for item in items:
+            if not isinstance(item, dict):
+                if isinstance(item, vim.ManagedEntity):
+                    unwrapped += 1
+                continue
+            for top_key, sub_paths in paths_by_key.items():
+                obj = item.get(top_key)
+                if isinstance(obj, vim.ManagedEntity):
+                    object_specs[obj] = vmodl.query.PropertyCollector.ObjectSpec(obj=obj, skip=False)
+                    paths_by_type.setdefault(type(obj), set()).update(sub_paths)
+        if unwrapped:
+            logger.warning("Property prefetch skipped %s items that are managed objects themselves; return them "
+                           "from fetch_data under a key (e.g. {'vm': vm}) to prefetch and render them", unwrapped)
+        if not object_specs:
+            return None
+
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=list(object_specs.values()),
+            propSet=[
+                vmodl.query.PropertyCollector.PropertySpec(type=obj_type, pathSet=sorted(paths), all=False)
+                for obj_type, paths in paths_by_type.items()
+            ],
+        )
+        try:
+            property_collector = api_client.RetrieveContent().propertyCollector
+            contents = property_collector.RetrieveContents([filter_spec])
+        except Exception as e:
+            logger.warning("Property prefetch failed, falling back to lazy lookups: %s", e)
+            return None
+
+        values_by_object = {content.obj: {prop.name: prop.val for prop in content.propSet} for content in contents}
+
+        prefetched = []
+        for item in items:
+            item_values = {}
+            if isinstance(item, dict):
+                for top_key in paths_by_key:
+                    obj = item.get(top_key)
+                    if isinstance(obj, vim.ManagedEntity) and values_by_object.get(obj):
+                        item_values[top_key] = values_by_object[obj]
+            prefetched.append(item_values)
+        return prefetched
+
     def get_nested_function(self, api_client, function_path):
         """
         Recursively get a function from the API client.
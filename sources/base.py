@@ -1,10 +1,46 @@
-
 class DataSource:
-    def __init__(self, config):
+    """
+    Base class for all sources and destinations.
+
+    Every implementation is constructed as `SourceClass(name, config)`, where config is its
+    api_definitions entry, and is registered under a `type` name in sources.registry.
+    authenticate() fills self.clients (API sessions, file paths, SNMP targets, ...), and
+    fetch_data() is then called once per client.
+    """
+    # Whether fetch_data returns a client's records in the same order on every call;
+    # resuming an interrupted run by item offset relies on it
+    stable_order = False
+
+    def __init__(self, name, config):
+        self.name = name
         self.config = config
+        self.clients = []
 
     def authenticate(self):
         raise NotImplementedError("Subclasses should implement this method!")
 
-    def fetch_data(self):
+    def fetch_data(self, obj_config, client, **hints):
+        """
+        Return an iterable of records (dicts, Rows or SDK objects) for one client.
+
+        Records are consumed one at a time, so implementations should be generators where
+        possible to stream large inputs without holding them in memory. Optional hints
+        that a source may use or ignore, but must accept:
+          since  - stored watermark of the object_mapping (incremental fetching)
+          fields - dotted property paths the mapping templates use (projection)
+        """
         raise NotImplementedError("Subclasses should implement this method!")
+
+    def get_watermark(self, obj_config, client):
+        """
+        Return a source-level high-water mark for client (e.g. a file mtime), or None
+        if the watermark should be derived from the watermark field of fetched records.
+        """
+        return None
+
+    def prefetch_properties(self, client, items, required_keys):
+        """
+        Optionally bulk-fetch the dotted property paths in required_keys for all items.
+        Returns one {item_key: {sub_path: value}} dict per item, or None if unsupported.
+        """
+        return None
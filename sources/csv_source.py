@@ -1,16 +1,21 @@
 import csv
 import os
+from operator import itemgetter
 from sources.base import DataSource
+from utils.log import get_logger
+from utils.row import Row, RowSchema
+from utils.watermark import is_comparable, is_newer, watermark_field
+
+logger = get_logger('csv')
 
 class CSVDataSource(DataSource):
+    stable_order = True
+
     def __init__(self, name, config):
         """
         Initialize the CSV data source.
         """
-        super().__init__(config)
-        self.name = name
-        self.config = config
-        self.clients = []  # Initialize the clients list (this will hold file paths)
+        super().__init__(name, config)  # clients will hold the file paths
 
     def authenticate(self):
         """
@@ -29,21 +34,72 @@ class CSVDataSource(DataSource):
 
         print(f"CSV files found and readable for {self.name}.")
 
-    def fetch_data(self, obj_config, file_path):
+    def get_watermark(self, obj_config, file_path):
+        """
+        Use the file modification time as the watermark when the mapping asks for `mtime`.
+        """
+        if watermark_field(obj_config) == 'mtime':
+            return os.path.getmtime(file_path)
+        return None
+
+    def fetch_data(self, obj_config, file_path, since=None, fields=None, **hints):
         """
-        Fetch raw data from the CSV file without applying any mapping.
+        Stream raw rows from the CSV file without applying any mapping.
+        When since is given, unchanged files are skipped entirely (`mtime` watermark)
+        or only rows whose watermark column is newer than since are returned.
+        When fields is given, only the columns the mapping uses are kept.
         """
         # Retrieve delimiter from source_mapping (use self.config to access source_mapping)
         delimiter = self.config['source_mapping'].get('delimiter', ',')
+        field = watermark_field(obj_config) if since is not None else None
+
+        if field == 'mtime':
+            if not is_newer(os.path.getmtime(file_path), since):
+                logger.info("Skipping unchanged CSV file %s.", file_path)
+                return
+            field = None
 
-        all_data = []
+        # Only the top-level part of a dotted key names a column
+        wanted = {key.split('.', 1)[0] for key in fields} if fields else None
 
         # Open the file and read the CSV content
         with open(file_path, encoding='utf-8-sig', mode='r') as file:
-            reader = csv.DictReader(file, delimiter=delimiter)
+            reader = csv.reader(file, delimiter=delimiter)
+            header = next(reader, None)
+            if header is None:
+                return
 
-            # Collect raw rows without mapping
-            for row in reader:
-                all_data.append(row)
+            # Resolve the projected columns to positions once, not per row; all rows of
+            # the file share one schema and only carry a tuple of values
+            positions = [index for index, name in enumerate(header) if wanted is None or name in wanted]
+            if not positions:
+                # None of the fields names a column: keep them all, like the parquet source
+                positions = list(range(len(header)))
+            schema = RowSchema(header[index] for index in positions)
+            width = len(header)
+            if len(positions) == width:
+                project = tuple
+            elif len(positions) == 1:
+                project = lambda values: (values[positions[0]],)
+            else:
+                project = itemgetter(*positions)
 
-        return all_data
\ No newline at end of file
+            # Collect raw rows without mapping
+            unknown = 0
+            for values in reader:
+                if not values:
+                    continue
+                if len(values) < width:
+                    values += [None] * (width - len(values))
+                elif len(values) > width:
+                    del values[width:]
+                row = Row(schema, project(values))
+                if field:
+                    if not is_comparable(row.get(field), since):
+                        unknown += 1
+                    elif not is_newer(row.get(field), since):
+                        continue
+                yield row
+            if unknown:
+                logger.warning("%s rows of %s have no usable %s value and were treated as changed",
+                               unknown, file_path, field)
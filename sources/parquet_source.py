@@ -0,0 +1,223 @@
+import os
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sources.base import DataSource
+from utils.log import get_logger
+from utils.row import Row, RowSchema, to_plain_record
+from utils.watermark import is_newer, watermark_field
+
+logger = get_logger('parquet')
+
+
+class ParquetDataSource(DataSource):
+    """
+    Parquet (or Arrow IPC / Feather) files read as Arrow record batches.
+
+        inventory:
+          type: parquet
+          source_mapping:
+            file_path:
+              - exports/devices.parquet     # a file or a directory of files
+            format: parquet                 # or 'arrow' / 'feather'
+            batch_size: 65536
+            filter:                         # pushed down to the scan for every mapping
+              - [status, '==', active]
+
+    An object_mapping can add its own `source_filter` triples. Only the columns the
+    mapping templates use are read, and filters plus the watermark are evaluated by the
+    Arrow scanner (skipping whole row groups by their statistics) before rows reach Python.
+    """
+    stable_order = True
+
+    OPERATORS = {
+        '==': lambda field, value: field == value,
+        '!=': lambda field, value: field != value,
+        '<': lambda field, value: field < value,
+        '<=': lambda field, value: field <= value,
+        '>': lambda field, value: field > value,
+        '>=': lambda field, value: field >= value,
+        'in': lambda field, value: field.isin(value),
+        'not in': lambda field, value: ~field.isin(value),
+    }
+
+    def __init__(self, name, config):
+        super().__init__(name, config)  # clients will hold the file or directory paths
+
+    def authenticate(self):
+        """
+        Check that the files exist and add their paths to self.clients.
+        """
+        for file_path in self.config['source_mapping']['file_path']:
+            if not os.path.exists(file_path):
+                raise FileNotFoundError(f"Parquet file not found: {file_path}")
+            if not os.access(file_path, os.R_OK):
+                raise PermissionError(f"Parquet file is not readable: {file_path}")
+            self.clients.append(file_path)
+
+        logger.info("Parquet files found and readable for %s.", self.name)
+
+    def _dataset(self, file_path):
+        return ds.dataset(file_path, format=self.config['source_mapping'].get('format', 'parquet'))
+
+    def get_watermark(self, obj_config, file_path):
+        """
+        Use the newest file modification time as the watermark when the mapping asks for `mtime`.
+        """
+        if watermark_field(obj_config) != 'mtime':
+            return None
+        if os.path.isdir(file_path):
+            return max((os.path.getmtime(path) for path in self._dataset(file_path).files), default=None)
+        return os.path.getmtime(file_path)
+
+    def _scalar(self, value, arrow_type):
+        """
+        Convert a filter or watermark value to the column type (watermarks are stored as
+        strings or numbers, the column may be a timestamp).
+        """
+        try:
+            return pa.scalar(value).cast(arrow_type)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+            return value
+
+    def _filter_expression(self, obj_config, schema, since):
+        conditions = list(self.config['source_mapping'].get('filter') or [])
+        conditions += obj_config.get('source_filter') or []
+
+        expression = None
+        field = watermark_field(obj_config)
+        if since is not None and field and field != 'mtime' and field in schema.names:
+            # Rows without a watermark value are treated as changed rather than skipped for good
+            expression = (ds.field(field) > self._scalar(since, schema.field(field).type)) | ds.field(field).is_null()
+
+        for column, operator, value in conditions:
+            if operator not in self.OPERATORS:
+                raise ValueError(f"Unsupported filter operator '{operator}' for {self.name}")
+            arrow_type = schema.field(column).type
+            if operator in ('in', 'not in'):
+                value = pa.array(value).cast(arrow_type)
+            else:
+                value = self._scalar(value, arrow_type)
+            condition = self.OPERATORS[operator](ds.field(column), value)
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    def fetch_data(self, obj_config, file_path, since=None, fields=None, **hints):
+        """
+        Stream rows from the file's record batches. Only the columns in fields are read;
+        config filters and the watermark are pushed down to the scanner.
+        """
+        if since is not None and watermark_field(obj_config) == 'mtime':
+            if not is_newer(self.get_watermark(obj_config, file_path), since):
+                logger.info("Skipping unchanged Parquet data %s.", file_path)
+                return
+
+        dataset = self._dataset(file_path)
+        schema = dataset.schema
+
+        # Only the top-level part of a dotted key names a column (struct columns become dicts)
+        columns = None
+        if fields:
+            wanted = {key.split('.', 1)[0] for key in fields}
+            columns = [name for name in schema.names if name in wanted] or None
+
+        batches = dataset.to_batches(
+            columns=columns,
+            filter=self._filter_expression(obj_config, schema, since),
+            batch_size=self.config['source_mapping'].get('batch_size', 65536),
+        )
+        row_schema = RowSchema(columns or schema.names)
+        for batch in batches:
+            # Convert column by column, then zip into one tuple per row
+            for values in zip(*(column.to_pylist() for column in batch.columns)):
+                yield Row(row_schema, values)
+
+
+class ParquetDumpWriter:
+    """
+    Tee of the records fetched for one object_mapping into a Parquet file, so the same
+    data can be replayed later through a `parquet` source instead of a slow API.
+
+    Records are detached into plain nested dicts limited to the fields the templates use,
+    so SDK objects are dumped with exactly the attribute paths the mapping needs. The
+    file schema is widened as batches arrive (a column that was all None so far gets the
+    type of its first values). The dump is a debugging aid: if it fails, it is disabled
+    with an error and the records keep flowing to the sync.
+    """
+    def __init__(self, path, fields=None, batch_size=10000):
+        self.path = path
+        self.fields = fields
+        self.batch_size = batch_size
+        self.rows = 0
+        self.failed = False
+        self._records = []
+        self._writer = None
+        # Written to a partial file that is renamed once complete
+        self._partial_path = f"{path}.partial"
+
+    def tee(self, records):
+        """
+        Yield records unchanged while buffering plain copies for the file.
+        """
+        for record in records:
+            if not self.failed:
+                try:
+                    self._records.append(to_plain_record(record, self.fields))
+                    if len(self._records) >= self.batch_size:
+                        self._flush()
+                except Exception as e:
+                    self._disable(e)
+            yield record
+
+    def _flush(self):
+        if not self._records:
+            return
+        inferred = pa.Table.from_pylist(self._records).schema
+        if self._writer is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._writer = pq.ParquetWriter(self._partial_path, inferred)
+        else:
+            schema = pa.unify_schemas([self._writer.schema, inferred], promote_options='permissive')
+            if not schema.equals(self._writer.schema):
+                self._widen(schema)
+        self._writer.write_table(pa.Table.from_pylist(self._records, schema=self._writer.schema))
+        self.rows += len(self._records)
+        self._records = []
+
+    def _widen(self, schema):
+        # A Parquet file has a single schema, so the rows written so far are rewritten
+        self._writer.close()
+        written = pq.read_table(self._partial_path)
+        columns = [
+            written.column(field.name).cast(field.type) if field.name in written.column_names
+            else pa.nulls(written.num_rows, field.type)
+            for field in schema
+        ]
+        self._writer = pq.ParquetWriter(self._partial_path, schema)
+        self._writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+
+    def _disable(self, error):
+        logger.error("Disabling Parquet dump %s: %s", self.path, error)
+        self.failed = True
+        self._records = []
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except Exception:
+                pass
+            self._writer = None
+        if os.path.exists(self._partial_path):
+            os.remove(self._partial_path)
+
+    def close(self):
+        if self.failed:
+            return
+        try:
+            self._flush()
+        except Exception as e:
+            self._disable(e)
+            return
+        if self._writer is not None:
+            self._writer.close()
+            os.replace(self._partial_path, self.path)
+            logger.info("Dumped %s records to %s", self.rows, self.path)
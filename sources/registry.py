@@ -0,0 +1,91 @@
+import importlib
+from importlib import metadata
+
+# Source type -> "module:Class". Modules are imported only when a configured source of
+# that type is actually used, so a CSV -> NetBox run never loads pandas, pyarrow, pysnmp or bravado.
+SOURCE_TYPES = {
+    'api': 'sources.api_source:APIDataSource',
+    'api-swagger': 'sources.api_source:APIDataSource',
+    'csv': 'sources.csv_source:CSVDataSource',
+    'xls': 'sources.xls_source:XLSDataSource',
+    'parquet': 'sources.parquet_source:ParquetDataSource',
+    'snmp': 'sources.snmp_source:SNMPDataSource',
+}
+
+# Installed packages can provide source types without touching this repo:
+#   [project.entry-points."nbsync.sources"]
+#   kafka = "acme_sources.kafka:KafkaSource"
+ENTRY_POINT_GROUP = 'nbsync.sources'
+
+_loaded = {}
+
+
+def register_source(source_type, source_class=None):
+    """
+    Register a DataSource subclass under a `type` name. Usable as a class decorator:
+
+        @register_source('queue')
+        class QueueSource(DataSource):
+            ...
+    """
+    def decorator(cls):
+        _loaded[source_type] = cls
+        return cls
+
+    if source_class is not None:
+        return decorator(source_class)
+    return decorator
+
+
+def _entry_point(source_type):
+    try:
+        entry_points = metadata.entry_points(group=ENTRY_POINT_GROUP)
+    except TypeError:
+        # Python < 3.10
+        entry_points = metadata.entry_points().get(ENTRY_POINT_GROUP, [])
+    for entry_point in entry_points:
+        if entry_point.name == source_type:
+            return entry_point
+    return None
+
+
+def _import_target(target):
+    module_name, class_name = target.split(':')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def get_source_class(source_type):
+    """
+    Import and return the DataSource class for source_type. Lookup order: classes
+    registered with register_source, built-in types, the 'nbsync.sources' entry point
+    group, and finally a literal "package.module:ClassName" type.
+    """
+    source_class = _loaded.get(source_type)
+    if source_class is not None:
+        return source_class
+
+    if source_type in SOURCE_TYPES:
+        source_class = _import_target(SOURCE_TYPES[source_type])
+    else:
+        entry_point = _entry_point(source_type)
+        if entry_point is not None:
+            source_class = entry_point.load()
+        elif ':' in source_type:
+            source_class = _import_target(source_type)
+        else:
+            raise ValueError(f"Unsupported source type '{source_type}'. Known types: {', '.join(available_source_types())}")
+
+    _loaded[source_type] = source_class
+    return source_class
+
+
+def available_source_types():
+    """
+    All source type names known without importing any source module.
+    """
+    try:
+        entry_points = metadata.entry_points(group=ENTRY_POINT_GROUP)
+    except TypeError:
+        entry_points = metadata.entry_points().get(ENTRY_POINT_GROUP, [])
+    names = set(SOURCE_TYPES) | set(_loaded) | {entry_point.name for entry_point in entry_points}
+    return sorted(name for name in names if ':' not in name)
@@ -6,8 +6,8 @@ from pysnmp.hlapi import (
 )
 
 class SNMPDataSource(DataSource):
-    def __init__(self, config):
-        super().__init__(config)
+    def __init__(self, name, config):
+        super().__init__(name, config)
         self.snmp_engine = SnmpEngine()
 
     def authenticate(self):
@@ -31,29 +31,27 @@ class SNMPDataSource(DataSource):
         else:
             raise ValueError(f"Unsupported SNMP version: {version}")
 
-    def fetch_data(self):
+        # Each target device is a client
+        self.clients = list(auth_params['targets'])
+
+    def fetch_data(self, obj_config, target, **hints):
         # Fetch data by performing SNMP walk or get based on OIDs in the config
-        targets = self.config['auth_params']['targets']
         oids = self.config['oid_mapping']
-        results = []
-
-        for target in targets:
-            transport_target = UdpTransportTarget((target, 161))
-            for oid_name, oid_value in oids.items():
-                oid_obj = ObjectIdentity(oid_value)
-                iterator = nextCmd(
-                    self.snmp_engine,
-                    self.auth_data,
-                    transport_target,
-                    ContextData(),
-                    ObjectType(oid_obj),
-                    lexicographicMode=False
-                )
-
-                for errorIndication, errorStatus, errorIndex, varBinds in iterator:
-                    if errorIndication or errorStatus:
-                        continue
-                    else:
-                        results.append({oid_name: varBinds[0][1].prettyPrint()})
-
-        return results
+
+        transport_target = UdpTransportTarget((target, 161))
+        for oid_name, oid_value in oids.items():
+            oid_obj = ObjectIdentity(oid_value)
+            iterator = nextCmd(
+                self.snmp_engine,
+                self.auth_data,
+                transport_target,
+                ContextData(),
+                ObjectType(oid_obj),
+                lexicographicMode=False
+            )
+
+            for errorIndication, errorStatus, errorIndex, varBinds in iterator:
+                if errorIndication or errorStatus:
+                    continue
+                else:
+                    yield {oid_name: varBinds[0][1].prettyPrint()}
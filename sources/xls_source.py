@@ -1,11 +1,26 @@
-
+import os
 import pandas as pd
 from sources.base import DataSource
+from utils.row import Row, RowSchema
 
 class XLSDataSource(DataSource):
-    def fetch_data(self):
-        all_data = []
+    stable_order = True
+
+    def authenticate(self):
+        """
+        Check the Excel files exist and are readable; each file is a client.
+        """
         for source_file in self.config['source_files']:  # Iterate through multiple Excel files
-            df = pd.read_excel(source_file, sheet_name=self.config.get('sheet_name', 0))
-            all_data.extend(df.to_dict(orient='records'))
-        return all_data
+            if not os.access(source_file, os.R_OK):
+                raise FileNotFoundError(f"Excel file not found or not readable: {source_file}")
+            self.clients.append(source_file)
+
+    def fetch_data(self, obj_config, source_file, fields=None, **hints):
+        # Only parse the columns the mapping uses (top-level part of dotted keys)
+        wanted = {key.split('.', 1)[0] for key in fields} if fields else None
+        usecols = (lambda column: column in wanted) if wanted else None
+        df = pd.read_excel(source_file, sheet_name=self.config.get('sheet_name', 0), usecols=usecols)
+        # Rows of one sheet share a schema instead of repeating column names per record
+        schema = RowSchema(str(column) for column in df.columns)
+        for values in df.itertuples(index=False, name=None):
+            yield Row(schema, values)
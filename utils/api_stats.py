@@ -0,0 +1,165 @@
+import functools
+import json
+import threading
+import time
+
+from utils.timer import Histogram
+
+
+class EndpointStats:
+    """
+    Call accounting for one API function path on one base_url.
+    """
+    __slots__ = ('calls', 'errors', 'latency', 'request_bytes', 'max_request_bytes', 'records')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram()
+        self.request_bytes = 0
+        self.max_request_bytes = 0
+        self.records = 0
+
+
+def _payload_size(args, kwargs):
+    """
+    Approximate request payload size as the length of the JSON-encoded arguments.
+    Encoding costs about as much as the request body itself, so it is opt-in.
+    """
+    if not args and not kwargs:
+        return 0
+    try:
+        return len(json.dumps([args, kwargs], default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _is_lazy_result(result):
+    """
+    pynetbox's filter()/all() return RecordSets that only hit the API when iterated.
+    Records (which have serialize()) and plain containers are returned as-is.
+    """
+    return (
+        not isinstance(result, (list, tuple, dict, str, bytes))
+        and hasattr(result, '__iter__')
+        and not hasattr(result, 'serialize')
+    )
+
+
+class ApiCallStats:
+    """
+    Per-endpoint accounting of destination API calls: call and error counts, latency
+    distribution, returned record counts and, with measure_payloads, request payload
+    sizes, keyed by base_url and function path (e.g. 'dcim.devices.filter').
+    """
+    def __init__(self, measure_payloads=False):
+        self.measure_payloads = measure_payloads
+        self._lock = threading.Lock()
+        # (base_url, function_path) -> EndpointStats
+        self.endpoints = {}
+
+    def _stats(self, base_url, function_path):
+        key = (base_url, function_path)
+        stats = self.endpoints.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self.endpoints.setdefault(key, EndpointStats())
+        return stats
+
+    def instrument(self, func, function_path, base_url=None):
+        """
+        Wrap an API callable so every call is counted and timed.
+        Lazy result sets are materialised inside the wrapper so the HTTP request is
+        attributed to the call that issued it (callers list them anyway, and testing a
+        pynetbox RecordSet for emptiness would cost a separate count request).
+        """
+        stats = self._stats(base_url, function_path)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            request_bytes = _payload_size(args, kwargs) if self.measure_payloads else 0
+            start = time.perf_counter_ns()
+            failed = False
+            records = 0
+            try:
+                result = func(*args, **kwargs)
+                if _is_lazy_result(result):
+                    result = list(result)
+                if isinstance(result, list):
+                    records = len(result)
+                elif result is not None:
+                    records = 1
+                return result
+            except Exception:
+                failed = True
+                raise
+            finally:
+                duration = time.perf_counter_ns() - start
+                with self._lock:
+                    stats.calls += 1
+                    stats.errors += failed
+                    stats.latency.record(duration)
+                    stats.request_bytes += request_bytes
+                    stats.max_request_bytes = max(stats.max_request_bytes, request_bytes)
+                    stats.records += records
+
+        return wrapper
+
+    def merge(self, endpoints):
+        """
+        Add the per-endpoint statistics of another ApiCallStats (e.g. of a worker process).
+        """
+        for key, other in endpoints.items():
+            stats = self._stats(*key)
+            with self._lock:
+                stats.calls += other.calls
+                stats.errors += other.errors
+                stats.latency.merge(other.latency)
+                stats.request_bytes += other.request_bytes
+                stats.max_request_bytes = max(stats.max_request_bytes, other.max_request_bytes)
+                stats.records += other.records
+
+    def summary(self):
+        """
+        Statistics per endpoint in milliseconds, most calls first.
+        """
+        with self._lock:
+            items = list(self.endpoints.items())
+        rows = []
+        for (base_url, function_path), stats in items:
+            if not stats.calls:
+                continue
+            rows.append({
+                'base_url': base_url,
+                'function': function_path,
+                'calls': stats.calls,
+                'errors': stats.errors,
+                'total_ms': stats.latency.total / 1e6,
+                'avg_ms': stats.latency.average / 1e6,
+                'p50_ms': stats.latency.percentile(50) / 1e6,
+                'p95_ms': stats.latency.percentile(95) / 1e6,
+                'p99_ms': stats.latency.percentile(99) / 1e6,
+                'max_ms': stats.latency.max / 1e6,
+                'request_bytes': stats.request_bytes,
+                'max_request_bytes': stats.max_request_bytes,
+                'records': stats.records,
+            })
+        rows.sort(key=lambda row: row['calls'], reverse=True)
+        return rows
+
+    def show(self):
+        rows = self.summary()
+        if not rows:
+            return
+        print("\n--\nAPI Calls (sorted by call count, ms):")
+        print(f"{'base_url / function':<60} {'calls':>8} {'errors':>7} {'avg':>8} {'p95':>8} {'max':>8} {'req KB':>9} {'records':>8}")
+        for row in rows:
+            label = f"{row['base_url'] or '-'} {row['function']}"
+            request_kb = f"{row['request_bytes'] / 1024:.1f}" if self.measure_payloads else '-'
+            print(f"{label:<60} {row['calls']:>8} {row['errors']:>7} {row['avg_ms']:>8.2f} {row['p95_ms']:>8.2f} "
+                  f"{row['max_ms']:>8.2f} {request_kb:>9} {row['records']:>8}")
+        print("\n")
+
+    def export_json(self, path):
+        with open(path, 'w') as f:
+            json.dump({'endpoints': self.summary()}, f, indent=2)
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+
+from utils.log import get_logger
+from utils.watermark import normalize_watermark, write_json_atomic
+
+logger = get_logger('checkpoint')
+
+
+def default_checkpoint_path(config_file):
+    """
+    Checkpoint file of a config, so runs of different configs from one directory
+    never share (or clear) each other's progress.
+    """
+    digest = hashlib.sha256(os.path.abspath(config_file).encode('utf-8')).hexdigest()
+    return f".nbsync_checkpoint-{digest[:12]}.json"
+
+
+class CheckpointStore:
+    """
+    Durable progress of a run of one config, per object_mapping and source client:
+
+        {"config": "/etc/nbsync/devices.yaml",
+         "progress": {"devices:netbox_csv:/data/devices.csv": {"offset": 1500, "done": false,
+                                                               "high_water_mark": "...", "created": 2}}}
+
+    created counts the objects the run created; their ids are appended to
+    <path>.created as JSON lines {"key": ..., "ids": [12, 13]}, so a checkpoint costs the
+    same to write however long the run gets. offset counts the source items already processed, in the order the source returns
+    them; a resumed run skips that many items. That is only correct for sources that
+    return their records in a stable order (files, snapshots), so the caller ignores the
+    offset of other sources. A checkpoint written for another config is never loaded.
+    """
+    def __init__(self, path, every=500, config_file=None):
+        self.path = path
+        self.every = every
+        self.config_file = os.path.abspath(config_file) if config_file else None
+        self.state = {}
+        self.created_path = f"{path}.created"
+        # The created log of a fresh run replaces any left behind by another one
+        self._append_created = False
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable checkpoint file %s: %s", self.path, e)
+            return
+        if not isinstance(data, dict) or 'progress' not in data or data.get('config') != self.config_file:
+            logger.warning("Ignoring checkpoint file %s: it was not written for %s", self.path, self.config_file)
+            return
+        self.state = data['progress']
+        self._append_created = True
+        logger.info("Resuming from checkpoint %s", self.path)
+
+    def get(self, key):
+        return self.state.get(key, {})
+
+    def update(self, key, offset, done=False, high_water_mark=None, created=()):
+        entry = self.state.setdefault(key, {'offset': 0, 'done': False, 'created': 0})
+        entry['offset'] = offset
+        entry['done'] = done
+        if high_water_mark is not None:
+            entry['high_water_mark'] = normalize_watermark(high_water_mark)
+        if created or not self._append_created:
+            self._log_created(key, list(created))
+            entry['created'] += len(created)
+        write_json_atomic(self.path, {'config': self.config_file, 'progress': self.state}, prefix='.checkpoint-')
+
+    def _log_created(self, key, ids):
+        with open(self.created_path, 'a' if self._append_created else 'w') as f:
+            if ids:
+                f.write(json.dumps({'key': key, 'ids': ids}, default=str) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._append_created = True
+
+    def clear(self):
+        """
+        Forget all progress; called once a run has completed every mapping.
+        """
+        self.state = {}
+        for path in (self.path, self.created_path):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,76 @@
+import hashlib
+import os
+import pickle
+import re
+import sys
+import tempfile
+
+from utils.log import get_logger
+
+logger = get_logger('config_cache')
+
+# Bump when the cached layout changes
+CACHE_VERSION = 1
+
+# $VAR and ${VAR}, as substituted by os.path.expandvars
+_ENV_REFERENCE = re.compile(r'\$(\w+)|\$\{([^}]+)\}')
+
+
+def referenced_env_vars(content):
+    """
+    Names of the environment variables a config file refers to.
+    """
+    return sorted({braced or bare for bare, braced in _ENV_REFERENCE.findall(content)})
+
+
+class ConfigCache:
+    """
+    Parsed configs and their compiled field templates, pickled to disk.
+
+    An entry is keyed by the config file's content, the values of the environment
+    variables it refers to, and the Python/PyYAML/Jinja2 versions (compiled templates
+    are marshalled code objects). Changing any of them simply misses the cache. Entries
+    contain the expanded environment values (tokens), so they are only readable by
+    their owner.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(content, versions=()):
+        digest = hashlib.sha256()
+        digest.update(repr((CACHE_VERSION, sys.version, tuple(versions))).encode('utf-8'))
+        digest.update(content.encode('utf-8'))
+        for name in referenced_env_vars(content):
+            digest.update(repr((name, os.environ.get(name))).encode('utf-8'))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"config-{key}.pickle")
+
+    def load(self, key):
+        """
+        The cached entry, or None on a miss or an unreadable entry.
+        """
+        try:
+            with open(self.path(key), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("Ignoring unreadable config cache entry %s: %s", key[:12], e)
+            return None
+
+    def store(self, key, data):
+        # mkstemp creates the file with mode 0600
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.config-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path(key))
+        except Exception as e:
+            logger.warning("Could not write config cache entry %s: %s", key[:12], e)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,217 @@
+import json
+import socket
+import sqlite3
+import threading
+import time
+
+from utils.log import get_logger
+from utils.sharding import LookupClaims
+
+logger = get_logger('coordinator')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    run_id TEXT, shard INTEGER, total INTEGER, host TEXT, status TEXT,
+    claimed_at REAL, finished_at REAL, results TEXT,
+    PRIMARY KEY (run_id, shard)
+);
+CREATE TABLE IF NOT EXISTS mappings (
+    run_id TEXT, obj_type TEXT, shard INTEGER, finished_at REAL,
+    PRIMARY KEY (run_id, obj_type, shard)
+);
+CREATE TABLE IF NOT EXISTS lookups (
+    run_id TEXT, key TEXT, id INTEGER, name TEXT,
+    PRIMARY KEY (run_id, key)
+);
+"""
+
+
+def parse_shard(value):
+    """
+    Parse --shard 'i/N' (0-based) or 'auto/N' into (index or None, total).
+    """
+    try:
+        index, total = value.split('/')
+        total = int(total)
+        index = None if index == 'auto' else int(index)
+    except ValueError:
+        raise ValueError(f"Invalid shard '{value}', expected i/N or auto/N")
+    if total < 1 or (index is not None and not 0 <= index < total):
+        raise ValueError(f"Invalid shard '{value}': index must be in 0..{total - 1}")
+    return index, total
+
+
+def _connect(path, timeout):
+    connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+    connection.execute('PRAGMA busy_timeout = %d' % int(timeout * 1000))
+    return connection
+
+
+class _Transaction:
+    """
+    Exclusive write transaction (BEGIN IMMEDIATE), usable as a context manager.
+    """
+    def __init__(self, store):
+        self.store = store
+
+    def __enter__(self):
+        self.store._conn().execute('BEGIN IMMEDIATE')
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.store._conn().execute('COMMIT' if exc_type is None else 'ROLLBACK')
+        return False
+
+
+class CoordinatorLookupStore(LookupClaims):
+    """
+    lookup_object results shared by every host (and worker process) of a run through
+    the coordinator database. Same interface as sharding.SharedLookupStore; an open
+    claim is a row without an id whose name is the claim token.
+    """
+    def __init__(self, path, run_id, timeout=60.0):
+        self.path = path
+        self.run_id = run_id
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __getstate__(self):
+        return {'path': self.path, 'run_id': self.run_id, 'timeout': self.timeout}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _conn(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = _connect(self.path, self.timeout)
+        return connection
+
+    def get(self, key):
+        row = self._conn().execute(
+            'SELECT id, name FROM lookups WHERE run_id = ? AND key = ? AND id IS NOT NULL', (self.run_id, key)
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def claimed(self, key):
+        return self._conn().execute(
+            'SELECT 1 FROM lookups WHERE run_id = ? AND key = ? AND id IS NULL', (self.run_id, key)
+        ).fetchone() is not None
+
+    def _claim(self, key, token):
+        cursor = self._conn().execute(
+            'INSERT OR IGNORE INTO lookups (run_id, key, id, name) VALUES (?, ?, NULL, ?)', (self.run_id, key, token)
+        )
+        return cursor.rowcount == 1
+
+    def set(self, key, value):
+        object_id, name = value
+        self._conn().execute(
+            'INSERT OR REPLACE INTO lookups (run_id, key, id, name) VALUES (?, ?, ?, ?)',
+            (self.run_id, key, object_id, name),
+        )
+
+    def release(self, key, token):
+        self._conn().execute(
+            'DELETE FROM lookups WHERE run_id = ? AND key = ? AND id IS NULL AND name = ?', (self.run_id, key, token)
+        )
+
+
+class Coordinator:
+    """
+    SQLite-backed coordination of one run split across hosts (--shard i/N or auto/N).
+
+    Hosts claim shards, record when each object_mapping is finished for their shard
+    (the barrier for mappings with `depends_on`), share lookup_object results, and store
+    their results for a run-wide summary. The database must be reachable by every host;
+    use a local disk, since SQLite locking over network filesystems is unreliable.
+    """
+    def __init__(self, path, run_id, total, timeout=60.0):
+        self.path = path
+        self.run_id = run_id
+        self.total = total
+        self.timeout = timeout
+        self.host = socket.gethostname()
+        self.shard = None
+        self._connection = _connect(path, timeout)
+        self._connection.executescript(SCHEMA)
+
+    def _transaction(self):
+        return _Transaction(self)
+
+    def _conn(self):
+        return self._connection
+
+    def claim(self, shard=None):
+        """
+        Claim shard (or, with None, the lowest shard nobody has claimed or that failed)
+        for this host and return its index.
+        """
+        with self._transaction():
+            rows = self._connection.execute(
+                'SELECT shard, status, host FROM shards WHERE run_id = ?', (self.run_id,)
+            ).fetchall()
+            taken = {index: (status, host) for index, status, host in rows}
+            if shard is None:
+                free = [index for index in range(self.total)
+                        if index not in taken or taken[index][0] == 'failed']
+                if not free:
+                    raise RuntimeError(f"All {self.total} shards of run {self.run_id} are already claimed")
+                shard = free[0]
+            elif shard in taken and taken[shard][0] == 'claimed' and taken[shard][1] != self.host:
+                logger.warning("Taking over shard %s of run %s from %s", shard, self.run_id, taken[shard][1])
+            self._connection.execute(
+                'INSERT OR REPLACE INTO shards (run_id, shard, total, host, status, claimed_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (self.run_id, shard, self.total, self.host, 'claimed', time.time()),
+            )
+        self.shard = shard
+        logger.info("Claimed shard %s/%s of run %s", shard, self.total, self.run_id)
+        return shard
+
+    def mapping_done(self, obj_type):
+        self._connection.execute(
+            'INSERT OR REPLACE INTO mappings (run_id, obj_type, shard, finished_at) VALUES (?, ?, ?, ?)',
+            (self.run_id, obj_type, self.shard, time.time()),
+        )
+
+    def wait_for(self, obj_types, timeout=3600.0, poll=2.0):
+        """
+        Block until every shard has finished the given object_mappings, so objects they
+        create (sites, roles, parents) exist before a dependent mapping looks them up.
+        """
+        deadline = time.monotonic() + timeout
+        for obj_type in obj_types:
+            logged = False
+            while True:
+                finished = self._connection.execute(
+                    'SELECT COUNT(*) FROM mappings WHERE run_id = ? AND obj_type = ?', (self.run_id, obj_type)
+                ).fetchone()[0]
+                if finished >= self.total:
+                    break
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Timed out waiting for {obj_type} on {self.total - finished} shard(s)")
+                if not logged:
+                    logger.info("Waiting for %s on %s more shard(s)", obj_type, self.total - finished)
+                    logged = True
+                time.sleep(poll)
+
+    def finish(self, results, failed=False):
+        self._connection.execute(
+            'UPDATE shards SET status = ?, finished_at = ?, results = ? WHERE run_id = ? AND shard = ?',
+            ('failed' if failed else 'done', time.time(), json.dumps(results, default=str), self.run_id, self.shard),
+        )
+
+    def summary(self):
+        """
+        Status and results of every shard of the run.
+        """
+        rows = self._connection.execute(
+            'SELECT shard, host, status, claimed_at, finished_at, results FROM shards WHERE run_id = ? ORDER BY shard',
+            (self.run_id,),
+        ).fetchall()
+        return [{'shard': shard, 'host': host, 'status': status, 'claimed_at': claimed_at, 'finished_at': finished_at,
+                 'results': json.loads(results) if results else None}
+                for shard, host, status, claimed_at, finished_at, results in rows]
+
+    def lookup_store(self):
+        return CoordinatorLookupStore(self.path, self.run_id, self.timeout)
@@ -0,0 +1,49 @@
+import datetime
+import json
+import threading
+
+from utils.log import get_logger
+from utils.rate_limit import http_status
+from utils.row import plain_value, to_plain_record
+
+logger = get_logger('dead_letter')
+
+
+class DeadLetterQueue:
+    """
+    JSON lines file of objects that could not be written after all retries. Each entry
+    holds the source item (the fields its mapping uses), the mapped payload so far and the
+    error, so the failed objects can be replayed on their own with --replay-failed.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def add(self, obj_type, stage, item, fields, payload, error, destination_api=None, parent_id=None):
+        entry = {
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'obj_type': obj_type,
+            'stage': stage,
+            'destination_api': destination_api,
+            'parent_id': parent_id,
+            'error': str(error),
+            'error_type': type(error).__name__,
+            'status': http_status(error),
+            'payload': plain_value(payload),
+            'item': to_plain_record(item, fields),
+        }
+        line = json.dumps(entry, default=str)
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+            self.count += 1
+        logger.error("%s failed during %s: %s (written to %s)", obj_type, stage, error, self.path)
+
+    @staticmethod
+    def read(path):
+        """
+        All entries of a dead-letter file.
+        """
+        with open(path, 'r') as f:
+            return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,85 @@
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+LOGGER_NAME = 'nbsync'
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+
+
+def get_logger(name=None):
+    """
+    Return the tool's logger, or a child logger (e.g. 'nbsync.resolver').
+    """
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line; fields passed with `extra={...}` are included as keys.
+    """
+    def format(self, record):
+        payload = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+def setup_logging(level='INFO', json_output=False, queued=True, stream=None):
+    """
+    Configure the tool's logger. With queued=True records are handed to a background
+    thread (QueueHandler/QueueListener) so slow stdout or file I/O never blocks the sync.
+    Messages below the level are discarded before any formatting happens.
+    """
+    global _listener
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    if json_output:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)-7s %(message)s'))
+
+    logger = get_logger()
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+    for existing in list(logger.handlers):
+        logger.removeHandler(existing)
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+    if queued:
+        log_queue = queue.SimpleQueue()
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=False)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    else:
+        logger.addHandler(handler)
+    return logger
+
+
+def shutdown_logging():
+    """
+    Flush and stop the background log writer, if one is running.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,152 @@
+import contextvars
+import queue
+import threading
+
+from utils.log import get_logger
+
+logger = get_logger('pipeline')
+
+_STOP = object()
+
+
+class SequenceTracker:
+    """
+    Completion of numbered items that finish out of order. contiguous is the number of
+    items from the start that are all complete, i.e. a safe checkpoint offset.
+    """
+    def __init__(self, start=0):
+        self.contiguous = start
+        self._done = set()
+        self._lock = threading.Lock()
+
+    def complete(self, seq):
+        with self._lock:
+            if seq < self.contiguous:
+                return
+            self._done.add(seq)
+            while self.contiguous in self._done:
+                self._done.remove(self.contiguous)
+                self.contiguous += 1
+
+
+class Stage:
+    """
+    One pipeline stage: func(payload) returns the payload for the next stage, or None
+    when the item is finished (excluded, dead-lettered or written).
+    """
+    def __init__(self, name, func, workers=1):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+
+
+class Pipeline:
+    """
+    Stages connected by bounded queues, each stage running its own worker threads.
+
+    The caller is the first stage (fetching) and feeds items with submit(). Every stage
+    worker owns a queue and items are routed to a worker by their key, so all items for
+    one destination object pass through every stage in order and are never written
+    concurrently. Full queues block the upstream stage, which bounds memory and lets slow
+    network stages overlap with CPU stages. on_complete(seq) is called once per item.
+    """
+    def __init__(self, stages, queue_size=100, on_complete=None):
+        self.stages = stages
+        self.on_complete = on_complete
+        self.error = None
+        self._abort = threading.Event()
+        self._queues = [[queue.Queue(maxsize=queue_size) for _ in range(stage.workers)] for stage in stages]
+        self._running = [stage.workers for stage in stages]
+        self._running_lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        for position, stage in enumerate(self.stages):
+            for worker in range(stage.workers):
+                # Each thread runs in a copy of the caller's context, so timer spans nest
+                # under the span that is open around the pipeline
+                context = contextvars.copy_context()
+                thread = threading.Thread(
+                    target=context.run, args=(self._work, position, worker),
+                    name=f"nbsync-{stage.name}-{worker}", daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def _put(self, position, key, message):
+        target = self._queues[position][key % len(self._queues[position])]
+        while not self._abort.is_set():
+            try:
+                target.put(message, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def submit(self, seq, key, payload):
+        """
+        Feed one item (key: stable integer, e.g. a hash of its key fields).
+        """
+        if self._abort.is_set():
+            self._raise()
+        self._put(0, key, (seq, key, payload))
+
+    def _work(self, position, worker):
+        stage = self.stages[position]
+        inbox = self._queues[position][worker]
+        last = position == len(self.stages) - 1
+        while True:
+            message = inbox.get()
+            if message is _STOP or self._abort.is_set():
+                break
+            seq, key, payload = message
+            try:
+                result = stage.func(payload)
+            except BaseException as e:
+                logger.error("Pipeline stage %s failed: %s", stage.name, e)
+                self.error = e
+                self._abort.set()
+                break
+            if result is None or last:
+                if self.on_complete:
+                    self.on_complete(seq)
+            else:
+                self._put(position + 1, key, (seq, key, result))
+
+        # The last worker of a stage to stop passes the stop on to the next stage
+        with self._running_lock:
+            self._running[position] -= 1
+            stage_done = self._running[position] == 0
+        if stage_done and not last:
+            for next_queue in range(len(self._queues[position + 1])):
+                self._put(position + 1, next_queue, _STOP)
+
+    def finish(self):
+        """
+        Wait until every submitted item has passed through all stages.
+        """
+        for worker in range(len(self._queues[0])):
+            self._put(0, worker, _STOP)
+        for thread in self._threads:
+            while thread.is_alive():
+                thread.join(timeout=0.5)
+                if self._abort.is_set():
+                    self._drain()
+        if self.error is not None:
+            self._raise()
+
+    def abort(self):
+        self._abort.set()
+        self._drain()
+
+    def _drain(self):
+        # Unblock workers waiting on a queue so they notice the abort
+        for queues in self._queues:
+            for inbox in queues:
+                try:
+                    inbox.put_nowait(_STOP)
+                except queue.Full:
+                    pass
+
+    def _raise(self):
+        raise RuntimeError(f"Pipeline aborted: {self.error}") from self.error
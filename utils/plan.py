@@ -0,0 +1,173 @@
+import hashlib
+import itertools
+import json
+import os
+import threading
+from collections import Counter
+
+from utils.log import get_logger
+from utils.row import plain_value
+
+logger = get_logger('plan')
+
+# Placeholder for the id of an object the plan creates; only whole values are replaced
+REF_PREFIX = '$ref:'
+
+
+def is_ref(value):
+    return isinstance(value, str) and value.startswith(REF_PREFIX)
+
+
+def _refs(value):
+    if is_ref(value):
+        return {value}
+    if isinstance(value, dict):
+        return set().union(*(_refs(v) for v in value.values())) if value else set()
+    if isinstance(value, list):
+        return set().union(*(_refs(v) for v in value)) if value else set()
+    return set()
+
+
+def resolve_refs(value, ids):
+    """
+    Replace placeholders with the ids of the objects created earlier in the apply.
+    """
+    if is_ref(value):
+        if value not in ids:
+            raise KeyError(f"Plan references {value}, which was not created")
+        return ids[value]
+    if isinstance(value, dict):
+        return {key: resolve_refs(item, ids) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve_refs(item, ids) for item in value]
+    return value
+
+
+class ChangePlan:
+    """
+    JSON lines change plan written by --plan: one entry per create, update or delete,
+    in an order in which they can be applied.
+
+        {"ref": "$ref:7", "obj_type": "devices", "action": "update", "destination_api": "netbox",
+         "client": 0, "function": "dcim.devices.update", "id": 42, "name": "sw1",
+         "payload": {...}, "changes": {"serial": {"old": "A1", "new": "A2"}}}
+
+    Objects that do not exist yet are referenced by their ref in the payloads of later
+    entries (nested objects under a new parent, lookups of a new object).
+    """
+    def __init__(self, path):
+        self.path = path
+        self.counts = Counter()
+        self._refs = itertools.count(1)
+        self._lock = threading.Lock()
+        self._file = open(path, 'w')
+
+    def add(self, obj_type, action, destination_api, client, function, payload=None, object_id=None, name=None,
+            changes=None):
+        """
+        Append an entry and return its ref.
+        """
+        with self._lock:
+            ref = f"{REF_PREFIX}{next(self._refs)}"
+            entry = {
+                'ref': ref,
+                'obj_type': obj_type,
+                'action': action,
+                'destination_api': destination_api,
+                'client': client,
+                'function': function,
+                'id': object_id,
+                'name': name,
+                'payload': plain_value(payload),
+                'changes': plain_value(changes),
+            }
+            self._file.write(json.dumps(entry, default=str) + '\n')
+            self.counts[(obj_type, action)] += 1
+        return ref
+
+    def close(self):
+        self._file.close()
+        for (obj_type, action), count in sorted(self.counts.items()):
+            logger.info("Plan: %s %s %s", action, count, obj_type)
+        logger.info("Wrote %s planned changes to %s", sum(self.counts.values()), self.path)
+
+    @staticmethod
+    def read(path):
+        """
+        All entries of a plan file.
+        """
+        with open(path, 'r') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+class AppliedLog:
+    """
+    Record of the plan entries apply_plan has executed, appended after each batch to
+    <plan>.applied as JSON lines {"ref": ..., "id": ...} (id of created objects). An
+    interrupted apply can be re-run: applied entries are skipped and refs resolve to the
+    ids created before. The log starts with a digest of the plan, so it is discarded
+    when the plan file is written again.
+    """
+    def __init__(self, plan_path):
+        self.path = f"{plan_path}.applied"
+        with open(plan_path, 'rb') as f:
+            self.digest = hashlib.sha256(f.read()).hexdigest()
+
+    def load(self):
+        """
+        {ref: id} of the entries already applied from this plan.
+        """
+        applied = {}
+        try:
+            with open(self.path, 'r') as f:
+                lines = [line for line in f if line.strip()]
+        except FileNotFoundError:
+            return applied
+        if not lines or json.loads(lines[0]).get('plan') != self.digest:
+            logger.warning("Ignoring %s: it was written for a different plan", self.path)
+            os.remove(self.path)
+            return applied
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Line cut short by an interrupted write
+                continue
+            applied[entry['ref']] = entry['id']
+        return applied
+
+    def record(self, entries, ids):
+        new_file = not os.path.exists(self.path)
+        with open(self.path, 'a') as f:
+            if new_file:
+                f.write(json.dumps({'plan': self.digest}) + '\n')
+            for entry in entries:
+                f.write(json.dumps({'ref': entry['ref'], 'id': ids.get(entry['ref'])}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def plan_batches(entries, batch_size=100):
+    """
+    Group entries into bulk calls of the same destination client, function and action.
+
+    Entries are ordered by depth, the length of the chain of planned creates their
+    payload refers to, so an object is always created in an earlier batch than the
+    entries referring to it, while e.g. the interfaces of all new devices still share
+    batches. Order is kept within a group, and deletes run last as in the plan.
+    """
+    depths, groups = {}, {}
+    for entry in entries:
+        if entry['action'] == 'delete':
+            depth = float('inf')
+        else:
+            # Refs to creates applied by an earlier run are already resolved
+            depth = 1 + max((depths.get(ref, -1) for ref in _refs(entry['payload'])), default=-1)
+            if entry['action'] == 'create':
+                depths[entry['ref']] = depth
+        key = (depth, entry['destination_api'], entry['client'], entry['function'], entry['action'])
+        groups.setdefault(key, []).append(entry)
+    for key in sorted(groups, key=lambda key: key[0]):
+        group = groups[key]
+        for start in range(0, len(group), batch_size):
+            yield group[start:start + batch_size]
@@ -0,0 +1,70 @@
+import cProfile
+import io
+import pstats
+import tracemalloc
+
+
+class RunProfiler:
+    """
+    Profile a whole sync run with cProfile and, optionally, track memory with tracemalloc
+    snapshots taken at each object_mapping boundary.
+    """
+    def __init__(self, profile_path=None, top=30, trace_memory=False, memory_frames=1, memory_top=10):
+        self.profile_path = profile_path
+        self.top = top
+        self.trace_memory = trace_memory
+        self.memory_frames = memory_frames
+        self.memory_top = memory_top
+        self.profile = cProfile.Profile() if profile_path else None
+        self.snapshots = []
+
+    def start(self):
+        if self.trace_memory:
+            tracemalloc.start(self.memory_frames)
+            self.snapshot('start')
+        if self.profile:
+            self.profile.enable()
+
+    def stop(self):
+        if self.profile:
+            self.profile.disable()
+        if self.trace_memory:
+            self.snapshot('end')
+            tracemalloc.stop()
+
+    def snapshot(self, label):
+        """
+        Take a tracemalloc snapshot and print the biggest allocation changes since the previous one.
+        """
+        if not self.trace_memory or not tracemalloc.is_tracing():
+            return
+        # Keep the profiler's own bookkeeping out of the measurements
+        if self.profile:
+            self.profile.disable()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        print(f"\n--\nMemory at '{label}': current {current / 1048576:.1f} MiB, peak {peak / 1048576:.1f} MiB")
+        if self.snapshots:
+            previous_label, previous = self.snapshots[-1]
+            print(f"Top allocation changes since '{previous_label}':")
+            for stat in snapshot.compare_to(previous, 'lineno')[:self.memory_top]:
+                print(f"  {stat}")
+        self.snapshots.append((label, snapshot))
+        if self.profile:
+            self.profile.enable()
+
+    def report(self):
+        """
+        Write the profile file and print the top functions by cumulative time.
+        """
+        if not self.profile:
+            return
+        self.profile.dump_stats(self.profile_path)
+        output = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=output)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+        print(f"\n--\nProfile written to {self.profile_path} (view with `python -m pstats {self.profile_path}`)")
+        print(output.getvalue())
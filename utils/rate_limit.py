@@ -0,0 +1,191 @@
+import functools
+import threading
+import time
+
+from utils.log import get_logger
+
+logger = get_logger('rate_limit')
+
+# Responses that mean "slow down" rather than "this request is wrong"
+THROTTLE_STATUSES = {429, 502, 503, 504}
+# Exception class names of client-side timeouts and refused/reset connections
+OVERLOAD_ERRORS = {'ConnectionError', 'Timeout', 'ReadTimeout', 'ConnectTimeout', 'TimeoutError'}
+
+
+def _response(exc):
+    """
+    The HTTP response carried by pynetbox, requests or bravado exceptions, if any.
+    """
+    for attr in ('req', 'response'):
+        response = getattr(exc, attr, None)
+        if response is not None and hasattr(response, 'status_code'):
+            return response
+    return None
+
+
+def http_status(exc):
+    """
+    HTTP status code of a failed API call, or None if the error has none.
+    """
+    response = _response(exc)
+    if response is not None:
+        return response.status_code
+    status = getattr(exc, 'status_code', None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after(exc):
+    """
+    Seconds the server asked us to wait (Retry-After header), or None.
+    """
+    response = _response(exc)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_overload(exc):
+    """
+    True if exc signals an overloaded destination (429, 5xx gateway errors, timeouts).
+    """
+    status = http_status(exc)
+    if status is not None:
+        return status in THROTTLE_STATUSES or status >= 500
+    return any(cls.__name__ in OVERLOAD_ERRORS for cls in type(exc).__mro__)
+
+
+class AdaptiveLimiter:
+    """
+    Token bucket plus AIMD concurrency limit for one destination (base_url).
+
+    Every call takes a token (if requests_per_second is set) and a concurrency slot.
+    Successful calls grow the concurrency limit, and the rate back towards its ceiling,
+    additively. 429/5xx responses, timeouts and latencies above latency_target_ms cut both
+    multiplicatively, at most once per cooldown. Overload errors also pause all callers
+    for the Retry-After time, or for cooldown seconds when the server sent none. Callers
+    block while no slot or token is free, so the limiter is also the backpressure for
+    concurrent stages.
+
+        netbox:
+          type: api
+          rate_limit:
+            requests_per_second: 20     # ceiling; omitted = no fixed rate
+            burst: 40
+            max_concurrency: 8
+            min_concurrency: 1
+            latency_target_ms: 2000
+    """
+    def __init__(self, name, requests_per_second=None, burst=None, max_concurrency=8, min_concurrency=1,
+                 latency_target_ms=None, min_rate=1.0, backoff=0.5, cooldown=1.0, recovery=None):
+        self.name = name
+        self.max_rate = requests_per_second
+        self.rate = requests_per_second
+        self.burst = burst or max(1.0, requests_per_second or 1.0)
+        self.tokens = self.burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(max_concurrency)
+        self.latency_target = latency_target_ms / 1000 if latency_target_ms else None
+        self.min_rate = min_rate
+        self.backoff = backoff
+        self.cooldown = cooldown
+        # Requests/s regained per second of successful traffic (default 5% of the ceiling)
+        self.recovery = recovery or max(1.0, (requests_per_second or 0) * 0.05)
+
+        self.in_flight = 0
+        self.throttled = 0
+        self.slowdowns = 0
+        self._cond = threading.Condition()
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+
+    @classmethod
+    def from_config(cls, name, config):
+        return cls(name, **(config or {}))
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self.in_flight >= max(self.min_concurrency, int(self.limit)):
+                    wait = None  # until a call completes
+                elif self.rate and self.tokens < 1:
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    if self.rate:
+                        self.tokens -= 1
+                    self.in_flight += 1
+                    return
+                self._cond.wait(wait)
+
+    def release(self, latency, error=None):
+        with self._cond:
+            now = time.monotonic()
+            self.in_flight -= 1
+            if error is not None and is_overload(error):
+                self.throttled += 1
+                self._decrease(now, retry_after(error) or self.cooldown)
+            elif self.latency_target and latency > self.latency_target:
+                self.slowdowns += 1
+                self._decrease(now)
+            elif error is None:
+                self._increase()
+            self._cond.notify_all()
+
+    def _decrease(self, now, pause=None):
+        if pause:
+            self._paused_until = max(self._paused_until, now + pause)
+        # One cut per cooldown: a burst of errors from the same overload counts once
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_concurrency), self.limit * self.backoff)
+        if self.rate:
+            self.rate = max(self.min_rate, self.rate * self.backoff)
+            self.tokens = min(self.tokens, 1.0)
+        logger.warning("Backing off %s: concurrency %.1f, %s requests/s%s", self.name, self.limit,
+                       f"{self.rate:.1f}" if self.rate else 'unlimited', f", paused {pause:.1f}s" if pause else "")
+
+    def _increase(self):
+        self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+        if self.rate:
+            self.rate = min(self.max_rate, self.rate + self.recovery / self.rate)
+
+    def wrap(self, func):
+        """
+        Wrap an API callable so every call goes through the limiter.
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            self.acquire()
+            start = time.perf_counter()
+            error = None
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                self.release(time.perf_counter() - start, error)
+
+        return wrapper
+
+    def summary(self):
+        return {
+            'destination': self.name,
+            'concurrency_limit': round(self.limit, 2),
+            'rate': round(self.rate, 2) if self.rate else None,
+            'throttled': self.throttled,
+            'slowdowns': self.slowdowns,
+        }
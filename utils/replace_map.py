@@ -0,0 +1,120 @@
+import os
+import re
+import threading
+
+# Characters that make a replace_map pattern a regular expression rather than a literal
+_REGEX_META = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+
+class ReplaceMapTable:
+    """
+    Compiled form of a replace_map file (one `pattern,replacement` per line).
+
+    Entries are applied in file order, each to the result of the previous one. When every
+    entry is a plain literal and no entry can affect another (no pattern contains, overlaps
+    or is produced by another entry), the whole table is applied in a single pass with one
+    alternation regex and a dict lookup, which gives the same result as the ordered
+    replacements. Otherwise literals use str.replace and regex entries precompiled patterns.
+    """
+    def __init__(self, entries):
+        self.entries = entries
+        self.literal = all(
+            not _REGEX_META.search(pattern) and '\\' not in replacement
+            for pattern, replacement in entries
+        )
+        self.combined = None
+        self.lookup = None
+        self.compiled = None
+
+        if self.literal:
+            if self._independent():
+                self.lookup = dict(entries)
+                # Longest first so the alternation prefers the longest literal at a position
+                alternatives = sorted(self.lookup, key=len, reverse=True)
+                self.combined = re.compile('|'.join(re.escape(pattern) for pattern in alternatives))
+        else:
+            self.compiled = [(re.compile(pattern), replacement) for pattern, replacement in entries]
+
+    @classmethod
+    def from_file(cls, filename):
+        entries = []
+        with open(filename, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                # Split each line into pattern and replacement
+                pattern, replacement = line.split(',')
+                if pattern:
+                    entries.append((pattern, replacement))
+        return cls(entries)
+
+    def _independent(self):
+        """
+        True if applying the entries in one pass is equivalent to applying them in order.
+        """
+        patterns = {pattern for pattern, _ in self.entries}
+        if len(patterns) != len(self.entries):
+            return False
+        prefixes = {pattern[:end] for pattern in patterns for end in range(1, len(pattern) + 1)}
+        suffixes = {pattern[start:] for pattern in patterns for start in range(len(pattern))}
+
+        for pattern in patterns:
+            length = len(pattern)
+            for start in range(length):
+                # Another pattern starting inside this one and running past its end
+                if start and pattern[start:] in prefixes:
+                    return False
+                # Another pattern contained in this one
+                for end in range(start + 1, length + 1):
+                    if (start, end) != (0, length) and pattern[start:end] in patterns:
+                        return False
+
+        substrings = None
+        for _, replacement in self.entries:
+            # Deletions can join their neighbours into a new match
+            if not replacement:
+                return False
+            if substrings is None:
+                substrings = {p[start:end] for p in patterns for start in range(len(p)) for end in range(start + 1, len(p) + 1)}
+            length = len(replacement)
+            if replacement in substrings:
+                return False
+            for start in range(length):
+                if replacement[start:] in prefixes or replacement[:start + 1] in suffixes:
+                    return False
+                for end in range(start + 1, length + 1):
+                    if replacement[start:end] in patterns:
+                        return False
+        return True
+
+    def apply(self, value):
+        if self.combined is not None:
+            lookup = self.lookup
+            return self.combined.sub(lambda match: lookup[match.group(0)], value)
+        if self.literal:
+            for pattern, replacement in self.entries:
+                if pattern in value:
+                    value = value.replace(pattern, replacement)
+            return value
+        for pattern, replacement in self.compiled:
+            value = pattern.sub(replacement, value)
+        return value
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def load_replace_map(filename):
+    """
+    Return the compiled table for filename, reloading it only when the file's mtime changes.
+    """
+    mtime = os.path.getmtime(filename)
+    cached = _tables.get(filename)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    table = ReplaceMapTable.from_file(filename)
+    with _tables_lock:
+        _tables[filename] = (mtime, table)
+    return table
@@ -1,11 +1,95 @@
 from collections import defaultdict
+from collections.abc import Mapping
+from utils.log import get_logger
+
+logger = get_logger('resolver')
+
+_MISSING = object()
+
+
+class PrefetchedNode:
+    """
+    Stand-in for an intermediate property (e.g. `runtime` of a VM) whose leaf values were
+    bulk-fetched. Attributes that were not prefetched fall back to the real object.
+    """
+    def __init__(self, parent, attr):
+        self._parent = parent
+        self._attr = attr
+        self._real = _MISSING
+
+    def _resolve_real(self):
+        if self._real is _MISSING:
+            self._real = getattr(self._parent, self._attr, None)
+        return self._real
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._resolve_real(), name)
+
+    def __str__(self):
+        return str(self._resolve_real())
+
+    def __repr__(self):
+        return repr(self._resolve_real())
+
+
+class ResolutionCache:
+    """
+    Memoise attribute lookups on the objects of a single source item, so lazy SDK
+    properties (pyVmomi, DNAC, ...) are fetched at most once per item no matter how
+    many field templates touch them. Shared by the Resolver and the Jinja environment.
+    """
+    def __init__(self):
+        # (id(obj), attr) -> (obj, value); obj is kept to guard against id reuse
+        self._values = {}
+
+    def getattr(self, obj, attr, default=None):
+        """
+        Return obj.attr, fetching it only the first time. Missing attributes return default.
+        """
+        key = (id(obj), attr)
+        hit = self._values.get(key)
+        if hit is not None and hit[0] is obj:
+            value = hit[1]
+        else:
+            value = getattr(obj, attr, _MISSING)
+            self._values[key] = (obj, value)
+        return default if value is _MISSING else value
+
+    def seed(self, obj, path, value):
+        """
+        Record a bulk-fetched value for a dotted path below obj.
+        """
+        parts = path.split('.')
+        for attr in parts[:-1]:
+            key = (id(obj), attr)
+            hit = self._values.get(key)
+            if hit is None or hit[0] is not obj:
+                hit = (obj, PrefetchedNode(obj, attr))
+                self._values[key] = hit
+            obj = hit[1]
+        self._values[(id(obj), parts[-1])] = (obj, value)
+
 
 class Resolver:
-    def __init__(self, item, required_keys=None):
+    def __init__(self, item, required_keys=None, cache=None):
         self.item = item
         self.required_keys = required_keys or []
+        self.cache = cache
         self.pre_resolved = self._pre_resolve()
 
+    def _get_attr(self, obj, attr):
+        """
+        Single attribute step: mapping lookup (dicts, Rows, ChainMaps), or a
+        (memoised) getattr on objects.
+        """
+        if isinstance(obj, (dict, Mapping)):
+            return obj.get(attr)
+        if self.cache is not None:
+            return self.cache.getattr(obj, attr)
+        return getattr(obj, attr, None)
+
 
     def _group_keys_by_prefix(self, keys):
         """
@@ -31,16 +115,12 @@ class Resolver:
             attrs = path.split('.')
             try:
                 for attr in attrs:
-                    if isinstance(current_obj, dict):
-                        current_obj = current_obj.get(attr)
-                    elif hasattr(current_obj, attr):
-                        current_obj = getattr(current_obj, attr, None)
-                    else:
-                        current_obj = None
+                    current_obj = self._get_attr(current_obj, attr)
+                    if current_obj is None:
                         break
                 results[path] = current_obj
             except Exception as e:
-                print(f"Error resolving nested path '{path}': {e}")
+                logger.error("Error resolving nested path '%s': %s", path, e)
                 results[path] = None
         return results
 
@@ -64,12 +144,7 @@ class Resolver:
                     full_path_str = '.'.join(full_path)
 
                     if full_path_str not in resolved:
-                        if isinstance(current_obj, dict):
-                            current_obj = current_obj.get(attr)
-                        elif hasattr(current_obj, attr):
-                            current_obj = getattr(current_obj, attr, None)
-                        else:
-                            current_obj = None
+                        current_obj = self._get_attr(current_obj, attr)
 
                         resolved[full_path_str] = current_obj
                         if current_obj is None:
@@ -87,7 +162,7 @@ class Resolver:
                         resolved[f"{prefix}.{suffix}"] = value
 
             except Exception as e:
-                print(f"Error resolving prefix '{prefix}': {e}")
+                logger.error("Error resolving prefix '%s': %s", prefix, e)
                 for key in keys:
                     resolved[key] = None  # Safeguard unresolved paths
 
@@ -102,17 +177,12 @@ class Resolver:
         current_obj = self.item
         try:
             for attr in attrs:
-                if isinstance(current_obj, dict):
-                    current_obj = current_obj.get(attr)
-                elif hasattr(current_obj, attr):
-                    current_obj = getattr(current_obj, attr, None)
-                else:
-                    current_obj = None
+                current_obj = self._get_attr(current_obj, attr)
                 if current_obj is None:
                     break
             return current_obj
         except Exception as e:
-            print(f"Error resolving '{attr_path}': {e}")
+            logger.error("Error resolving '%s': %s", attr_path, e)
             return None
 
     def __getitem__(self, attr):
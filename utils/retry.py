@@ -0,0 +1,68 @@
+import functools
+import random
+import time
+
+from utils.log import get_logger
+from utils.rate_limit import http_status, is_overload, retry_after
+
+logger = get_logger('retry')
+
+# Statuses that guarantee the server did not process the request, so even
+# non-idempotent calls (creates) can be repeated safely
+NOT_PROCESSED_STATUSES = {429, 503}
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter for transient API errors: 429/5xx responses,
+    timeouts and connection errors. The Retry-After header wins over the computed delay.
+
+        netbox:
+          type: api
+          retry:
+            attempts: 4         # total tries per call
+            base_delay: 0.5     # seconds, doubled on every retry
+            max_delay: 30
+    """
+    def __init__(self, attempts=4, base_delay=0.5, max_delay=30.0):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(**(config or {}))
+
+    def delay(self, attempt, error=None):
+        server_delay = retry_after(error) if error is not None else None
+        if server_delay is not None:
+            return min(server_delay, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def should_retry(self, error, idempotent=True):
+        if idempotent:
+            return is_overload(error)
+        return http_status(error) in NOT_PROCESSED_STATUSES
+
+    def wrap(self, func, name, idempotent=True):
+        """
+        Wrap an API callable so transient failures are retried. Non-idempotent calls
+        (creates) are only retried when the server certainly rejected the request, since
+        a timed-out create may still have been applied.
+        """
+        if self.attempts == 1:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(self.attempts):
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    if attempt + 1 >= self.attempts or not self.should_retry(e, idempotent):
+                        raise
+                    delay = self.delay(attempt, e)
+                    logger.warning("%s failed (%s), retry %s/%s in %.1fs", name, e, attempt + 1, self.attempts - 1, delay)
+                    time.sleep(delay)
+
+        return wrapper
@@ -0,0 +1,112 @@
+import datetime
+from collections.abc import Mapping
+
+
+class RowSchema:
+    """
+    Column layout shared by every row read from one tabular source (CSV sheet, XLS sheet, ...).
+    """
+    __slots__ = ('columns', 'index')
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+        self.index = {name: position for position, name in enumerate(self.columns)}
+
+    def __reduce__(self):
+        return (RowSchema, (self.columns,))
+
+
+class Row(Mapping):
+    """
+    Compact, read-only record: a shared RowSchema plus a tuple of values.
+    Behaves like a dict for the Resolver and Jinja (`row['name']`, `row.get()`, `{**row}`)
+    without storing the column names in every row.
+    """
+    __slots__ = ('_schema', '_values')
+
+    def __init__(self, schema, values):
+        self._schema = schema
+        self._values = values
+
+    def __getitem__(self, key):
+        return self._values[self._schema.index[key]]
+
+    def get(self, key, default=None):
+        position = self._schema.index.get(key)
+        return default if position is None else self._values[position]
+
+    def __contains__(self, key):
+        return key in self._schema.index
+
+    def __iter__(self):
+        return iter(self._schema.columns)
+
+    def __len__(self):
+        return len(self._schema.columns)
+
+    def __eq__(self, other):
+        if isinstance(other, Row) and other._schema is self._schema:
+            return self._values == other._values
+        return Mapping.__eq__(self, other)
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return (Row, (self._schema, self._values))
+
+    def __repr__(self):
+        return f"Row({dict(zip(self._schema.columns, self._values))!r})"
+
+
+_PLAIN_TYPES = (str, int, float, bool, bytes, datetime.date, datetime.time, type(None))
+
+
+def plain_value(value):
+    """
+    Copy of value made of plain Python types only; other objects become their str().
+    """
+    if isinstance(value, _PLAIN_TYPES):
+        return value
+    if isinstance(value, Mapping):
+        return {str(key): plain_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [plain_value(item) for item in value]
+    return str(value)
+
+
+def _get_field(obj, name):
+    if isinstance(obj, Mapping):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def _plain_fields(value, paths):
+    if not paths:
+        return plain_value(value)
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return [_plain_fields(item, paths) for item in value]
+    return to_plain_record(value, paths)
+
+
+def to_plain_record(item, fields=None):
+    """
+    Detach a source record (dict, Row or SDK object) into nested plain dicts.
+
+    With fields (dotted paths as used by the templates), only those paths are kept:
+    'vm.runtime.powerState' becomes {'vm': {'runtime': {'powerState': ...}}}, so the
+    same templates render against the copy. Lists along a path are copied item by item.
+    """
+    if not fields:
+        if isinstance(item, Mapping):
+            return {str(key): plain_value(value) for key, value in item.items()}
+        return {'value': plain_value(item)}
+
+    tree = {}
+    for path in fields:
+        head, _, rest = path.partition('.')
+        sub_paths = tree.setdefault(head, set())
+        if rest:
+            sub_paths.add(rest)
+    return {head: _plain_fields(_get_field(item, head), sub_paths) for head, sub_paths in tree.items()}
@@ -0,0 +1,241 @@
+import multiprocessing
+import queue
+import time
+import traceback
+import uuid
+import zlib
+from collections.abc import Mapping
+
+from utils.log import get_logger, setup_logging
+from utils.row import to_plain_record
+
+logger = get_logger('sharding')
+
+
+def key_hash(key_values):
+    """
+    Stable hash of a key (same in every process and run, unlike hash()).
+    """
+    return zlib.crc32(repr(key_values).encode('utf-8'))
+
+
+def shard_of(key_values, shards):
+    return key_hash(key_values) % shards
+
+
+def shard_key(item, key_paths):
+    """
+    Values of item behind key_paths, as plain values (the repr of an SDK object
+    includes its address, so it would not be stable).
+    """
+    if isinstance(item, Mapping) and not any('.' in path for path in key_paths):
+        return tuple(item.get(path) for path in key_paths)
+    return to_plain_record(item, key_paths)
+
+
+class LookupClaims:
+    """
+    Find-or-create coordination of a shared lookup store. Finds run unlocked; on a miss,
+    one caller per key claims the create (an insert-if-absent) and the others wait for
+    its result, so two shards never create the same object and misses on different keys
+    never queue behind each other. Subclasses implement get, claimed, _claim, set and
+    release.
+    """
+    def claim(self, key):
+        """
+        Claim the create of key; returns a token for set/release, or None if the key is
+        already claimed or resolved.
+        """
+        token = uuid.uuid4().hex
+        return token if self._claim(key, token) else None
+
+    def wait(self, key, timeout=60.0, interval=0.05):
+        """
+        (id, name) of key once its claimant has stored it, or None if the claim was
+        released (the create failed) or is still open after timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            value = self.get(key)
+            if value is not None or not self.claimed(key):
+                return value
+            if time.monotonic() >= deadline:
+                logger.warning("Gave up waiting for another worker to create lookup %s", key)
+                return None
+            time.sleep(interval)
+
+
+class SharedLookupStore(LookupClaims):
+    """
+    lookup_object results shared by all worker processes, so an object looked up or
+    created by one shard is reused by the others. Only (id, name) pairs are shared; an
+    open claim is stored as its token.
+    """
+    def __init__(self, manager):
+        self.values = manager.dict()
+
+    def get(self, key):
+        value = self.values.get(key)
+        return value if isinstance(value, tuple) else None
+
+    def claimed(self, key):
+        return isinstance(self.values.get(key), str)
+
+    def _claim(self, key, token):
+        # setdefault runs in the manager process, so it is atomic across workers
+        return self.values.setdefault(key, token) == token
+
+    def set(self, key, value):
+        self.values[key] = tuple(value)
+
+    def release(self, key, token):
+        if self.values.get(key) == token:
+            self.values.pop(key, None)
+
+
+class LookupRef:
+    """
+    Stand-in for a destination object found through the shared lookup store.
+    """
+    __slots__ = ('id', 'name')
+
+    def __init__(self, id, name=None):
+        self.id = id
+        self.name = name
+
+    def __repr__(self):
+        return f"LookupRef(id={self.id!r}, name={self.name!r})"
+
+
+def _worker_main(index, options, obj_type, tasks, results, lookups):
+    """
+    Worker process: its own DataTransferTool and destination sessions, processing the
+    batches of one shard of obj_type until it receives None.
+    """
+    try:
+        import data_transfer_tool
+        from utils.dead_letter import DeadLetterQueue
+
+        setup_logging(options['log_level'], json_output=options['log_json'], queued=False)
+        tool = data_transfer_tool.DataTransferTool(options['config_file'], options['dry_run'], options['debug'],
+                                                   config_cache=options['config_cache'])
+        tool.shared_lookups = lookups
+        tool.api_stats.measure_payloads = options['measure_payloads']
+        tool.dead_letters = DeadLetterQueue(options['dead_letter_file'])
+        tool.nested_workers = options['nested_workers']
+        tool.nested_batch_size = options['nested_batch_size']
+        tool.initialize_sources(destinations_only=True)
+        obj_config = tool.config['object_mappings'][obj_type]
+        destination_api = tool.sources[obj_config['destination_api']]
+
+        processed = 0
+        for batch in iter(tasks.get, None):
+            for item in batch:
+                tool.process_single_mapping(obj_type, obj_config, destination_api, item)
+            processed += len(batch)
+
+        results.put({
+            'worker': index,
+            'processed': processed,
+            'timer': data_transfer_tool.timer.state(),
+            'api_stats': tool.api_stats.endpoints,
+            'failures': tool.failures,
+            'created_ids': tool.created_ids,
+            'seen_keys': tool.seen_keys,
+        })
+    except BaseException:
+        results.put({'worker': index, 'error': traceback.format_exc()})
+
+
+class ShardedRun:
+    """
+    Process the items of one object_mapping in worker processes. Items are routed to a
+    worker by a stable hash of the values behind the mapping's key fields, so all rows
+    for one destination object land on the same worker. Items are sent in batches over
+    bounded queues, which throttles the parent when the workers fall behind.
+    """
+    def __init__(self, processes, options, obj_type, key_paths, fields, lookups, batch_size=200, queue_batches=4):
+        self.processes = processes
+        self.obj_type = obj_type
+        self.key_paths = key_paths
+        self.fields = fields
+        self.batch_size = batch_size
+        self.submitted = 0
+
+        # Fresh interpreters: nothing (sockets, logging threads) is inherited from the parent
+        context = multiprocessing.get_context('spawn')
+        self.results = context.Queue()
+        self.tasks = [context.Queue(maxsize=queue_batches) for _ in range(processes)]
+        self.batches = [[] for _ in range(processes)]
+        self.workers = [
+            context.Process(target=_worker_main, args=(index, options, obj_type, self.tasks[index], self.results, lookups),
+                            name=f"nbsync-{obj_type}-{index}", daemon=True)
+            for index in range(processes)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, item):
+        shard = shard_of(shard_key(item, self.key_paths), self.processes)
+        if not isinstance(item, Mapping):
+            # SDK objects are bound to the parent's session; send the fields the templates use
+            item = to_plain_record(item, self.fields)
+        batch = self.batches[shard]
+        batch.append(item)
+        self.submitted += 1
+        if len(batch) >= self.batch_size:
+            self._send(shard)
+
+    def _send(self, shard):
+        self._put(shard, self.batches[shard])
+        self.batches[shard] = []
+
+    def _put(self, shard, message):
+        while True:
+            try:
+                self.tasks[shard].put(message, timeout=1)
+                return
+            except queue.Full:
+                self._check_workers()
+
+    def _check_workers(self):
+        # Workers only exit after their final None, so an exited worker has failed
+        for worker in self.workers:
+            if not worker.is_alive():
+                raise RuntimeError(f"Worker {worker.name} stopped early (exit code {worker.exitcode}): "
+                                   f"{self._worker_error()}")
+
+    def _worker_error(self):
+        try:
+            return self.results.get(timeout=1).get('error', '')
+        except queue.Empty:
+            return ''
+
+    def finish(self):
+        """
+        Flush the remaining batches, stop the workers and return their results.
+        """
+        for shard in range(self.processes):
+            if self.batches[shard]:
+                self._send(shard)
+            self._put(shard, None)
+
+        results = []
+        while len(results) < self.processes:
+            try:
+                results.append(self.results.get(timeout=1))
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in self.workers) and self.results.empty():
+                    raise RuntimeError(f"Workers for {self.obj_type} exited without reporting results")
+        for worker in self.workers:
+            worker.join()
+
+        errors = [result['error'] for result in results if 'error' in result]
+        if errors:
+            raise RuntimeError(f"{len(errors)} worker(s) for {self.obj_type} failed:\n" + "\n".join(errors))
+        return results
+
+    def terminate(self):
+        for worker in self.workers:
+            if worker.is_alive():
+                worker.terminate()
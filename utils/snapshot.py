@@ -0,0 +1,134 @@
+import gzip
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import time
+from utils.log import get_logger
+from utils.row import to_plain_record
+
+logger = get_logger('snapshot')
+
+# object_mapping keys that decide what a source returns; templates can change freely
+FETCH_KEYS = ('fetch_data_code', 'fetch_data_function', 'imports', 'source_filter', 'watermark')
+
+# Bump when the snapshot layout changes
+SNAPSHOT_VERSION = 2
+
+
+def covers(stored_fields, fields):
+    """
+    Whether a snapshot of stored_fields (None: whole records) has every path in fields.
+    """
+    if stored_fields is None:
+        return True
+    if fields is None:
+        return False
+    return all(any(path == stored or path.startswith(stored + '.') for stored in stored_fields) for path in fields)
+
+
+class SnapshotCache:
+    """
+    Compressed on-disk snapshots of source.fetch_data() results, so slow fetches (vCenter,
+    DNAC, ...) can be replayed while iterating on templates or after a destination failure.
+
+    A snapshot is a gzip stream of pickled records, keyed by source, client, the fetch
+    configuration (fetch code, imports, filters) and `since`, but not by the fields the
+    templates use. It starts with a header listing the fields it holds, and is reused
+    while they cover the fields of the current templates (records are projected on read);
+    a template using a new field refetches it with both sets of fields. Records that can't
+    be pickled (SDK objects bound to a live session) are stored as plain nested dicts of
+    those fields. Snapshots older than ttl seconds are refetched, except in replay mode
+    which uses whatever snapshot exists and never fetches.
+    """
+    def __init__(self, cache_dir, ttl=3600, replay=False):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.replay = replay
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(source, obj_config, client_key, since=None):
+        fetch_config = {name: obj_config.get(name) for name in FETCH_KEYS}
+        payload = json.dumps(
+            [SNAPSHOT_VERSION, source.name, source.config, client_key, fetch_config, since], sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl.gz")
+
+    def is_fresh(self, key):
+        path = self.path(key)
+        if not os.path.exists(path):
+            return False
+        return self.replay or not self.ttl or time.time() - os.path.getmtime(path) < self.ttl
+
+    def stored_fields(self, key):
+        """
+        Fields the records of a snapshot hold (None: whole records).
+        """
+        with gzip.open(self.path(key), 'rb') as f:
+            return pickle.load(f)['fields']
+
+    def read(self, key, fields=None):
+        """
+        Stream the records of a snapshot, projected to fields when it holds more.
+        """
+        with gzip.open(self.path(key), 'rb') as f:
+            stored_fields = pickle.load(f)['fields']
+            project = bool(fields) and set(fields) != set(stored_fields or ())
+            while True:
+                try:
+                    record = pickle.load(f)
+                except EOFError:
+                    return
+                yield to_plain_record(record, fields) if project else record
+
+    def write_through(self, key, records, fields=None):
+        """
+        Yield records unchanged while writing them to a snapshot. The snapshot is only
+        published once records is exhausted; an interrupted fetch leaves no partial file.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.snapshot-')
+        count = 0
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=3) as f:
+                f.write(pickle.dumps({'fields': sorted(fields) if fields else None}, protocol=pickle.HIGHEST_PROTOCOL))
+                for record in records:
+                    try:
+                        data = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+                    except Exception:
+                        data = pickle.dumps(to_plain_record(record, fields), protocol=pickle.HIGHEST_PROTOCOL)
+                    f.write(data)
+                    count += 1
+                    yield record
+            os.replace(tmp_path, self.path(key))
+            logger.info("Saved source snapshot %s (%s records)", key[:12], count)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def fetch(self, source, obj_config, client, client_key, hints):
+        """
+        Records for one source client: from a fresh snapshot if there is one, otherwise
+        fetched and written through to a new snapshot. Returns (records, from_snapshot).
+        """
+        fields = hints.get('fields')
+        key = self.key(source, obj_config, client_key, hints.get('since'))
+        if self.is_fresh(key):
+            stored_fields = self.stored_fields(key)
+            if covers(stored_fields, fields) or self.replay:
+                if not covers(stored_fields, fields):
+                    logger.warning("Snapshot %s lacks some fields the templates use; they will be empty", key[:12])
+                logger.info("Replaying %s client %s from snapshot %s", source.name, client_key, key[:12])
+                return self.read(key, fields), True
+            # Refetch with the fields of both, so going back to the old templates still hits
+            hints = dict(hints, fields=sorted(set(stored_fields) | set(fields)) if fields else None)
+            logger.info("Refetching %s client %s: the templates use fields snapshot %s lacks",
+                        source.name, client_key, key[:12])
+        elif self.replay:
+            raise FileNotFoundError(f"No source snapshot for {source.name} client {client_key} in {self.cache_dir}")
+        records = source.fetch_data(obj_config, client, **hints)
+        return self.write_through(key, records, hints.get('fields')), False
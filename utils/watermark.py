@@ -0,0 +1,144 @@
+import datetime
+import json
+import os
+import tempfile
+
+from utils.log import get_logger
+
+logger = get_logger('watermark')
+
+
+def normalize_watermark(value):
+    """
+    Convert a watermark value into something that can be persisted as JSON.
+    """
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _is_timestamp(value):
+    try:
+        datetime.datetime.fromisoformat(str(value))
+        return True
+    except ValueError:
+        return False
+
+
+def is_comparable(value, since):
+    """
+    Return True if value is a watermark that can be ordered against since: present, and
+    numeric or ISO-8601 like since is.
+    """
+    if value is None or value == '':
+        return False
+    value = normalize_watermark(value)
+    if _is_number(since):
+        return _is_number(value)
+    if _is_timestamp(since):
+        return _is_timestamp(value)
+    return True
+
+
+def is_newer(value, since):
+    """
+    Return True if value is strictly newer than the since watermark.
+    Numeric-looking values are compared as numbers, everything else as strings
+    (ISO-8601 timestamps and change sequences sort correctly either way).
+    A missing or unparsable value counts as newer: syncing a row again is safe,
+    while skipping it would skip it in every later incremental run too.
+    """
+    if since is None or not is_comparable(value, since):
+        return True
+    value = normalize_watermark(value)
+    try:
+        return float(value) > float(since)
+    except (TypeError, ValueError):
+        return str(value) > str(since)
+
+
+def max_watermark(current, value):
+    """
+    Return the higher of two watermark values, ignoring missing and unparsable ones.
+    """
+    if value is None or value == '':
+        return current
+    if current is not None and not is_comparable(value, current):
+        return current
+    if current is None or is_newer(value, current):
+        return normalize_watermark(value)
+    return current
+
+
+def write_json_atomic(path, data, prefix='.nbsync-'):
+    """
+    Write data as JSON through a temporary file and a rename, so readers never see a
+    truncated file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=prefix)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class WatermarkStore:
+    """
+    Persist high-water marks per object_mapping and source client between runs.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.marks = self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable watermark file %s: %s", self.path, e)
+            return {}
+
+    @staticmethod
+    def key(obj_type, source_name, client_key):
+        return f"{obj_type}:{source_name}:{client_key}"
+
+    def get(self, key):
+        return self.marks.get(key)
+
+    def set(self, key, value):
+        if value is not None:
+            self.marks[key] = normalize_watermark(value)
+
+    def save(self):
+        """
+        Atomically write the watermarks so an interrupted run never leaves a truncated file.
+        """
+        write_json_atomic(self.path, self.marks, prefix='.watermarks-')
+
+
+def watermark_field(obj_config):
+    """
+    Return the watermark field declared by an object_mapping, accepting either
+    `watermark: last_updated` or `watermark: {field: last_updated}`.
+    """
+    watermark = obj_config.get('watermark')
+    if isinstance(watermark, dict):
+        return watermark.get('field')
+    return watermark